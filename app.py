@@ -1,15 +1,83 @@
 import streamlit as st
 import pandas as pd
+import tempfile
+import time
 from datetime import datetime, timedelta
+from pathlib import Path
 from src.bybit_client import BybitClient
-from src.db_manager import DBManager
-from src.config import SUPPORTED_TIMEFRAMES, DEFAULT_TIMEFRAME
+from src.db_manager import create_db_manager, write_chunks
+from src.config import SUPPORTED_TIMEFRAMES, DEFAULT_TIMEFRAME, SUPPORTED_PERIODS, DEFAULT_PERIOD, DEFAULT_CATEGORY, EXPORT_DIR
+from src import config
 from src.logger import logger, clear_logs
-from src.utils import style_pnl_column, style_side_column
-from src.plotting import plot_detailed_pnl_chart, plot_aggregated_pnl_chart
+from src.utils import style_pnl_column, style_side_column, get_period_start
 
 st.set_page_config(page_title="Bybit PNL Dashboard", layout="wide")
 
+def is_session_active(session_id):
+    """Indica se la sessione Streamlit è ancora aperta"""
+    from streamlit.runtime import Runtime
+    return not Runtime.exists() or Runtime.instance().is_active_session(session_id)
+
+def get_session_id():
+    """Identificativo della sessione corrente, usato per registrarsi agli stream live"""
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx else 'default'
+
+@st.cache_resource
+def get_live_stream(account_name):
+    """
+    Restituisce lo stream live dell'account, condiviso tra tutte le sessioni:
+    resta attivo finché almeno una sessione aperta lo utilizza
+    """
+    # Import ritardato: websockets viene caricato solo se la modalità live viene attivata
+    from src.live_stream import LivePnlStream
+    return LivePnlStream(account_name, is_subscriber_active=is_session_active)
+
+def wait_for_live_updates():
+    """
+    Con la modalità live attiva tiene lo script in attesa e lo riesegue quando lo stream salva
+    nuovi trades, così metriche, grafici e tabelle si aggiornano senza interazioni dell'utente.
+    A ogni controllo aggiorna un elemento della pagina: è lì che Streamlit interrompe l'attesa
+    quando l'utente modifica un widget o chiude la sessione.
+    """
+    live_account = st.session_state.get('live_account')
+    if not live_account:
+        return
+    live_stream = get_live_stream(live_account)
+    last_update = live_stream.last_update
+    status = st.sidebar.empty()
+    while live_stream.is_running():
+        if live_stream.last_update != last_update:
+            st.rerun()
+        status.caption(f"Live: checked at {datetime.now():%H:%M:%S}")
+        time.sleep(config.LIVE_REFRESH_INTERVAL)
+
+def export_download(label, file_name, write):
+    """
+    Scrive un'esportazione in una cartella temporanea della sessione e la offre per il download.
+    Sessioni diverse non si sovrascrivono i file e la cartella viene eliminata subito dopo:
+    il contenuto resta solo nella memoria di Streamlit fino al rerun successivo.
+
+    :param label: Etichetta del pulsante di download
+    :param file_name: Nome del file scaricato
+    :param write: Funzione che scrive il file nel percorso ricevuto e restituisce le righe scritte
+    :return: Numero di righe esportate
+    """
+    Path(EXPORT_DIR).mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=EXPORT_DIR, prefix=f"{get_session_id()}_") as tmp_dir:
+        path = Path(tmp_dir) / file_name
+        rows = write(path)
+        st.download_button(label, path.read_bytes(), file_name=file_name, use_container_width=True)
+    return rows
+
+def sync_fees_and_funding(db, client, start_time, end_time):
+    """Scarica esecuzioni e funding per lo stesso periodo dei PNL chiusi e li salva nel database"""
+    if not config.SYNC_FEES_AND_FUNDING:
+        return
+    db.save_executions(client.get_executions_dataframe(start_time, end_time))
+    db.save_funding(client.get_funding_dataframe(start_time, end_time))
+
 def get_initial_data(db, client):
     """Carica i dati iniziali nel database se è vuoto"""
     try:
@@ -21,6 +89,7 @@ def get_initial_data(db, client):
             df = client.get_pnl_dataframe(start_time, end_time)
             if not df.empty:
                 db.save_trades(df)
+                sync_fees_and_funding(db, client, start_time, end_time)
                 st.success("Initial data loaded successfully!")
             else:
                 st.error("No data available from Bybit")
@@ -66,14 +135,32 @@ def main():
         st.session_state.current_account = selected_account
         st.rerun()  # Ricarica la pagina
         
-    # Inizializza/aggiorna il DBManager per l'account corrente
-    st.session_state.db = DBManager(st.session_state.current_account)
+    # Inizializza/aggiorna il database manager (pandas o DuckDB) per l'account corrente
+    st.session_state.db = create_db_manager(st.session_state.current_account)
+    # Il client apre la sessione HTTP (e importa pybit) solo alla prima richiesta verso Bybit
     client = BybitClient(st.session_state.current_account)
     
     # Carica i dati iniziali se necessario
     if not get_initial_data(st.session_state.db, client):
         return
     
+    # Aggiornamento live via WebSocket (opzionale, lo stream viene creato solo se attivato)
+    live_enabled = st.sidebar.checkbox("Live updates", key="live_updates",
+                                       help="Stream closed trades from Bybit between refreshes")
+    live_account = st.session_state.current_account if live_enabled else None
+    previous_live_account = st.session_state.get('live_account')
+    if previous_live_account and previous_live_account != live_account:
+        # La sessione lascia lo stream precedente, che resta attivo per le altre sessioni che lo usano
+        get_live_stream(previous_live_account).unsubscribe(get_session_id())
+        st.session_state.pop('live_account')
+    if live_account:
+        live_stream = get_live_stream(live_account)
+        live_stream.subscribe(get_session_id())
+        st.session_state.live_account = live_account
+        if live_stream.last_update:
+            st.sidebar.caption(f"Last live update: {datetime.fromtimestamp(live_stream.last_update):%H:%M:%S} "
+                               f"({live_stream.trades_received} trades)")
+    
     # Refresh buttons
     with col_refresh_week:
         if st.button("🔄 Refresh Week", use_container_width=True, help="Refresh last week's data"):
@@ -87,20 +174,9 @@ def main():
                 new_df = client.get_pnl_dataframe(start_time, end_time)
                 
                 if not new_df.empty:
-                    # Carica i dati esistenti
-                    existing_df = st.session_state.db.get_trades()
-                    
-                    if not existing_df.empty:
-                        # Rimuovi i dati dell'ultima settimana dal DataFrame esistente
-                        mask = existing_df['updatedTime'] < start_time
-                        existing_df = existing_df[mask]
-                        
-                        # Concatena i nuovi dati con quelli esistenti
-                        combined_df = pd.concat([existing_df, new_df])
-                        st.session_state.db.save_trades(combined_df)
-                    else:
-                        # Se non ci sono dati esistenti, salva solo i nuovi
-                        st.session_state.db.save_trades(new_df)
+                    # Aggiorna solo i trades dell'ultima settimana, senza riscrivere l'intera tabella
+                    st.session_state.db.upsert_trades(new_df)
+                    sync_fees_and_funding(st.session_state.db, client, start_time, end_time)
                         
                     st.success("Weekly data refreshed successfully!")
                 else:
@@ -118,6 +194,7 @@ def main():
                 df = client.get_pnl_dataframe(start_time, end_time)
                 if not df.empty:
                     st.session_state.db.save_trades(df)
+                    sync_fees_and_funding(st.session_state.db, client, start_time, end_time)
                     st.success("Full year data loaded successfully!")
                 else:
                     st.error("No data available from Bybit")
@@ -128,27 +205,14 @@ def main():
     # Period selection
     period = st.sidebar.selectbox(
         "Period",
-        ["7D", "1M", "3M", "6M", "1Y", "YTD", "All"],
-        index=1
+        SUPPORTED_PERIODS,
+        index=SUPPORTED_PERIODS.index(DEFAULT_PERIOD)
     )
     
     # Calculate start and end dates for filters
     end_time = datetime.now()
     # Per le query dei filtri usiamo la data corrente
-    if period == "7D":
-        start_time = end_time - timedelta(days=7)
-    elif period == "1M":
-        start_time = end_time - timedelta(days=30)
-    elif period == "3M":
-        start_time = end_time - timedelta(days=90)
-    elif period == "6M":
-        start_time = end_time - timedelta(days=180)
-    elif period == "1Y":
-        start_time = end_time - timedelta(days=365)
-    elif period == "YTD":
-        start_time = datetime(end_time.year, 1, 1)
-    else:  # All
-        start_time = None
+    start_time = get_period_start(period, end_time)
         
     logger.info(f"Selected period: {period} ({start_time} to {end_time})")
     
@@ -168,12 +232,28 @@ def main():
     
     # Load filtered data from database
     df = st.session_state.db.get_trades(start_time, end_time)
+    # Aggiunge fee e funding ai trades, se disponibili
+    df = st.session_state.db.add_fees_and_funding(df)
     
     if df.empty:
         st.error("No data available for the selected period")
         logger.warning("No data available for the selected period")
         return
         
+    # Category filter: una categoria alla volta, perché il PNL dei contratti linear è in USDT
+    # e quello degli inverse nella moneta base e non possono essere sommati
+    categories = sorted(df["category"].dropna().unique().tolist())
+    selected_category = st.sidebar.selectbox(
+        "Category",
+        categories,
+        index=categories.index(DEFAULT_CATEGORY) if DEFAULT_CATEGORY in categories else 0,
+        help="Linear PNL is in USDT, inverse PNL in the base coin"
+    )
+    
+    # Apply category filter
+    df = df[df["category"] == selected_category]
+    logger.info(f"Filtered by category: {selected_category}")
+        
     # Get unique symbols for the filter
     symbols = ["All"] + sorted(df["symbol"].unique().tolist())
     selected_symbol = st.sidebar.selectbox(
@@ -205,22 +285,47 @@ def main():
     # General statistics
     col1, col2, col3, col4 = st.columns(4)
     
-    total_pnl = df['closedPnl'].sum()
-    total_trades = len(df)
-    win_rate = (df['closedPnl'] > 0).mean() * 100
-    avg_pnl = df['closedPnl'].mean()
+    # Con il backend DuckDB filtri e statistiche vengono calcolati direttamente nel motore SQL
+    query_filters = {
+        'symbol': selected_symbol if selected_symbol != "All" else None,
+        'side': selected_side if selected_side != "Both" else None,
+        'category': selected_category,
+    }
+    if config.QUERY_BACKEND == 'duckdb':
+        metrics = st.session_state.db.get_metrics(start_time, end_time, **query_filters)
+        total_pnl = metrics['total_pnl']
+        total_trades = metrics['total_trades']
+        win_rate = metrics['win_rate']
+        avg_pnl = metrics['avg_pnl']
+    else:
+        total_pnl = df['closedPnl'].sum()
+        total_trades = len(df)
+        win_rate = (df['closedPnl'] > 0).mean() * 100
+        avg_pnl = df['closedPnl'].mean()
     
     col1.metric("Total PNL", f"{total_pnl:.2f}")
     col2.metric("Total Trades", total_trades)
     col3.metric("Win Rate", f"{win_rate:.1f}%")
     col4.metric("Avg PNL", f"{avg_pnl:.2f}")
     
+    # Gross vs net PNL breakdown
+    has_fees = 'net_pnl' in df.columns
+    if has_fees:
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Gross PNL", f"{df['gross_pnl'].sum():.2f}", help="Position PNL before trading fees and funding")
+        col2.metric("Trading Fees", f"{-df['fees'].sum():.2f}")
+        col3.metric("Funding", f"{df['funding'].sum():.2f}")
+        col4.metric("Net PNL", f"{df['net_pnl'].sum():.2f}", help="Closed PNL: position PNL after trading fees and funding")
+    
     # For plotting, sort chronologically
     df_plot = df.sort_values('updatedTime').set_index('updatedTime')
     logger.debug(f"Plotting DataFrame shape: {df_plot.shape}")
     
     # PNL chart
     try:
+        # Import ritardato: plotly viene caricato solo quando c'è un grafico da disegnare
+        from src.plotting import plot_detailed_pnl_chart, plot_aggregated_pnl_chart
+        
         if chart_type == "Detailed":
             fig = plot_detailed_pnl_chart(df_plot, "PNL Analysis")
         else:
@@ -235,7 +340,10 @@ def main():
     
     # Aggregated data
     st.header("Aggregated Data")
-    aggregated_df = client.aggregate_pnl(df, timeframe)
+    if config.QUERY_BACKEND == 'duckdb':
+        aggregated_df = st.session_state.db.aggregate_pnl(timeframe, start_time, end_time, **query_filters)
+    else:
+        aggregated_df = BybitClient.aggregate_pnl(df, timeframe)
     # Sort aggregated data with most recent first and apply styling
     aggregated_df = aggregated_df.sort_values('updatedTime', ascending=False)
     
@@ -255,16 +363,18 @@ def main():
     
     # Riordina le colonne
     columns_order = ['updatedTime', 'trades', 'fillCount', 'closedPnl', 'pct', 'winRate', 'avg_duration', 'duration']
-    aggregated_df = aggregated_df[columns_order]
+    fee_columns = [col for col in ['gross_pnl', 'fees', 'funding', 'net_pnl'] if col in aggregated_df.columns]
+    aggregated_df = aggregated_df[columns_order + fee_columns]
     
     st.dataframe(
         aggregated_df.style.applymap(
             style_pnl_column,
-            subset=['closedPnl', 'pct']
+            subset=['closedPnl', 'pct'] + [col for col in ['gross_pnl', 'net_pnl'] if col in fee_columns]
         ).format({
             'closedPnl': '{:.2f}',
             'pct': '{:.2f}%',
-            'winRate': '{:.1f}%'
+            'winRate': '{:.1f}%',
+            **{col: '{:.2f}' for col in fee_columns}
         })
     )
     
@@ -274,14 +384,15 @@ def main():
     df['duration'] = (pd.to_datetime(df['updatedTime']) - pd.to_datetime(df['createdTime'])).apply(
         lambda x: f"{int(x.total_seconds()//3600)}h {int((x.total_seconds()%3600)/60)}m"
     )
+    trade_fee_columns = ['fees', 'funding', 'net_pnl'] if has_fees else []
     trades_df = df[[
-        'symbol', 'side', 'closedSize', 'avgEntryPrice', 'avgExitPrice',
-        'closedPnl', 'pct', 'duration', 'createdTime', 'updatedTime'
+        'symbol', 'category', 'side', 'closedSize', 'avgEntryPrice', 'avgExitPrice',
+        'closedPnl', 'pct', *trade_fee_columns, 'duration', 'createdTime', 'updatedTime'
     ]]
     st.dataframe(
         trades_df.style.applymap(
             style_pnl_column,
-            subset=['closedPnl', 'pct']
+            subset=['closedPnl', 'pct'] + (['net_pnl'] if has_fees else [])
         ).applymap(
             style_side_column,
             subset=['side']
@@ -289,9 +400,33 @@ def main():
             'pct': '{:.2f}%',
             'closedPnl': '{:.2f}',
             'avgEntryPrice': '{:.2f}',
-            'avgExitPrice': '{:.2f}'
+            'avgExitPrice': '{:.2f}',
+            **{col: '{:.4f}' for col in trade_fee_columns}
         })
     )
+    
+    # Export: i trades vengono letti dal database e scritti su file a blocchi
+    st.header("Export")
+    col_format, col_export_trades, col_export_aggregated = st.columns([1, 2, 2])
+    export_format = col_format.selectbox("Format", ["csv", "parquet"])
+    export_prefix = f"{st.session_state.db.account}_{period}"
+    
+    with col_export_trades:
+        if st.button("📤 Export Trades", use_container_width=True, help="Export the filtered trades"):
+            rows = export_download(
+                "Download Trades", f"{export_prefix}_trades.{export_format}",
+                lambda path: st.session_state.db.export_trades(path, export_format, start_time, end_time, **query_filters)
+            )
+            st.success(f"Exported {rows} trades")
+    
+    with col_export_aggregated:
+        if st.button("📤 Export Aggregated", use_container_width=True, help="Export the aggregated table"):
+            rows = export_download(
+                "Download Aggregated", f"{export_prefix}_aggregated_{timeframe}.{export_format}",
+                lambda path: write_chunks([aggregated_df], path, export_format)
+            )
+            st.success(f"Exported {rows} rows")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
+    wait_for_live_updates()
\ No newline at end of file
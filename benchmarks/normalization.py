@@ -0,0 +1,119 @@
+"""
+Benchmark della normalizzazione dei record closed PnL (BybitClient._build_dataframe).
+
+Genera record sintetici nello stesso formato restituito da Bybit (valori numerici come
+stringhe) e confronta l'implementazione attuale con la versione precedente, basata su
+pd.DataFrame + pd.to_numeric colonna per colonna, misurando:
+- tempo: durata della conversione (time.perf_counter)
+- memoria: picco di memoria allocata durante la conversione (tracemalloc, in un'esecuzione separata)
+Verifica inoltre che le due implementazioni producano lo stesso DataFrame.
+
+Uso:
+    python benchmarks/normalization.py --records 1000000
+"""
+import argparse
+import gc
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from src.bybit_client import BybitClient
+
+
+def legacy_build_dataframe(pnl_data):
+    """Normalizzazione precedente, mantenuta come riferimento"""
+    df = pd.DataFrame(pnl_data)
+    if not df.empty:
+        df['createdTime'] = pd.to_numeric(df['createdTime'])
+        df['updatedTime'] = pd.to_numeric(df['updatedTime'])
+        df['createdTime'] = pd.to_datetime(df['createdTime'], unit='ms')
+        df['updatedTime'] = pd.to_datetime(df['updatedTime'], unit='ms')
+        numeric_columns = ['closedSize', 'cumEntryValue', 'avgEntryPrice',
+                           'avgExitPrice', 'closedPnl', 'fillCount']
+        for col in numeric_columns:
+            if col in df.columns:
+                df[col] = pd.to_numeric(df[col], errors='coerce')
+        df['side'] = np.where(df['side'] == 'Sell', 'Buy', 'Sell')
+        if 'category' not in df.columns:
+            df['category'] = 'linear'
+        df['invested_capital'] = np.where(
+            df['category'] == 'inverse',
+            df['closedSize'] / df['avgEntryPrice'],
+            df['closedSize'] * df['avgEntryPrice']
+        )
+        df['pct'] = (df['closedPnl'] / df['invested_capital'] * 100).round(2)
+    return df
+
+
+def create_records(count):
+    """Crea record sintetici nel formato dell'endpoint closed-pnl"""
+    rng = np.random.default_rng(0)
+    updated = 1700000000000 + rng.integers(0, 365 * 24 * 3600 * 1000, count)
+    created = updated - rng.integers(60000, 36000000, count)
+    size = rng.uniform(0.001, 5, count).round(3)
+    entry = rng.uniform(100, 60000, count).round(2)
+    exit_ = (entry * rng.uniform(0.95, 1.05, count)).round(2)
+    pnl = rng.normal(0, 50, count).round(8)
+    symbols = rng.choice(['BTCUSDT', 'ETHUSDT', 'SOLUSDT', 'BTCUSD'], count)
+    sides = rng.choice(['Buy', 'Sell'], count)
+    fills = rng.integers(1, 10, count)
+    return [
+        {
+            'symbol': symbols[i], 'orderType': 'Market', 'leverage': '10', 'updatedTime': str(updated[i]),
+            'side': sides[i], 'orderId': f'order-{i}', 'closedPnl': str(pnl[i]), 'avgEntryPrice': str(entry[i]),
+            'qty': str(size[i]), 'cumEntryValue': str(size[i] * entry[i]), 'createdTime': str(created[i]),
+            'orderPrice': str(exit_[i]), 'closedSize': str(size[i]), 'avgExitPrice': str(exit_[i]),
+            'execType': 'Trade', 'fillCount': str(fills[i]), 'cumExitValue': str(size[i] * exit_[i]),
+            'category': 'inverse' if symbols[i] == 'BTCUSD' else 'linear',
+        }
+        for i in range(count)
+    ]
+
+
+def measure(function, records):
+    """
+    Esegue la conversione e restituisce risultato, durata in secondi e picco di memoria in MB.
+    Tempo e memoria vengono misurati in due esecuzioni separate perché tracemalloc rallenta l'esecuzione.
+    """
+    gc.collect()
+    start = time.perf_counter()
+    df = function(records)
+    elapsed = time.perf_counter() - start
+    del df
+
+    gc.collect()
+    tracemalloc.start()
+    df = function(records)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return df, elapsed, peak / 1024 / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark closed PnL normalization")
+    parser.add_argument("--records", type=int, default=1000000)
+    args = parser.parse_args()
+
+    records = create_records(args.records)
+    client = BybitClient.__new__(BybitClient)
+    client.account_name = 'bench'
+
+    legacy, legacy_time, legacy_peak = measure(legacy_build_dataframe, records)
+    current, current_time, current_peak = measure(client._build_dataframe, records)
+    pd.testing.assert_frame_equal(current, legacy)
+
+    print(f"records: {args.records}")
+    print(f"legacy : {legacy_time:8.2f} s  peak {legacy_peak:8.1f} MB")
+    print(f"current: {current_time:8.2f} s  peak {current_peak:8.1f} MB")
+    print(f"speedup: {legacy_time / current_time:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
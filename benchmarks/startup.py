@@ -0,0 +1,106 @@
+"""
+Benchmark dei tempi di avvio della dashboard.
+
+Per ogni ripetizione avvia un processo Python nuovo che esegue app.py con lo
+strumento di test di Streamlit (AppTest), misurando:
+- fresh: import + primo run dello script in un processo appena avviato
+- rerun: secondo run dello script nello stesso processo (moduli già importati)
+e riporta quali dipendenze pesanti sono state caricate.
+
+Uso:
+    python benchmarks/startup.py --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parent.parent
+HEAVY_MODULES = ['pybit', 'requests', 'plotly', 'websockets', 'aiohttp', 'duckdb']
+# Prefisso della riga con i risultati del processo figlio: l'app scrive i log su stdout,
+# anche dopo il risultato (es. chiusura dei pool di connessioni all'uscita)
+RESULT_PREFIX = 'RESULT:'
+
+CHILD = f"""
+import json, sys, time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file({str(ROOT / 'app.py')!r}, default_timeout=120)
+at.run()
+fresh = time.perf_counter() - start
+start = time.perf_counter()
+at.run()
+rerun = time.perf_counter() - start
+errors = [str(e.value) for e in at.exception]
+loaded = [m for m in {HEAVY_MODULES!r} if m in sys.modules]
+print({RESULT_PREFIX!r} + json.dumps({{'fresh': fresh, 'rerun': rerun, 'loaded': loaded, 'errors': errors}}), flush=True)
+"""
+
+
+def create_sample_database(data_dir, trades=5000):
+    """Crea un database SQLite con trades sintetici per l'account di benchmark"""
+    rng = np.random.default_rng(0)
+    updated = pd.Timestamp.now() - pd.to_timedelta(rng.integers(0, 365 * 24 * 60, trades), unit='m')
+    df = pd.DataFrame({
+        'symbol': rng.choice(['BTCUSDT', 'ETHUSDT', 'SOLUSDT'], trades),
+        'category': 'linear',
+        'orderId': [f'bench-{i}' for i in range(trades)],
+        'side': rng.choice(['Buy', 'Sell'], trades),
+        'closedSize': rng.uniform(0.01, 1, trades),
+        'avgEntryPrice': rng.uniform(100, 1000, trades),
+        'avgExitPrice': rng.uniform(100, 1000, trades),
+        'closedPnl': rng.normal(0, 10, trades),
+        'fillCount': rng.integers(1, 5, trades),
+        'createdTime': updated - pd.to_timedelta(rng.integers(1, 600, trades), unit='m'),
+        'updatedTime': updated,
+    })
+    df['invested_capital'] = df['closedSize'] * df['avgEntryPrice']
+    df['pct'] = (df['closedPnl'] / df['invested_capital'] * 100).round(2)
+
+    sys.path.insert(0, str(ROOT))
+    cwd = os.getcwd()
+    os.chdir(data_dir.parent)
+    try:
+        from src.db_manager import DBManager
+        db = DBManager('bench')
+        db.save_trades(df)
+        db.close()
+    finally:
+        os.chdir(cwd)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dashboard startup time")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        create_sample_database(workdir / "data")
+        env = dict(os.environ, BYBIT_API_KEY_BENCH='key', BYBIT_API_SECRET_BENCH='secret',
+                   PYTHONPATH=str(ROOT))
+
+        results = []
+        for _ in range(args.runs):
+            output = subprocess.run([sys.executable, "-c", CHILD], cwd=workdir, env=env,
+                                    capture_output=True, text=True, check=True).stdout
+            result = next(line for line in output.splitlines() if line.startswith(RESULT_PREFIX))
+            results.append(json.loads(result[len(RESULT_PREFIX):]))
+
+    if any(r['errors'] for r in results):
+        print(f"App raised errors: {results[0]['errors']}")
+    for key in ('fresh', 'rerun'):
+        values = [r[key] * 1000 for r in results]
+        print(f"{key:>6}: median {statistics.median(values):8.1f} ms  min {min(values):8.1f} ms")
+    print(f"heavy modules loaded: {', '.join(results[0]['loaded']) or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
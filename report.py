@@ -0,0 +1,188 @@
+"""
+Genera un report statico (grafici HTML e riepiloghi JSON/CSV) per tutti gli account configurati,
+leggendo solo i database locali e senza avviare Streamlit.
+
+Esempio (es. da cron):
+    python report.py --period 1M --timeframe 1d --output reports
+    python report.py --start 2024-01-01 --end 2024-03-31 --output reports/q1
+    python report.py --period 1Y --export exports/trades.parquet
+"""
+import argparse
+import json
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pandas as pd
+
+from src import config
+from src.bybit_client import BybitClient
+from src.db_manager import DBManager, export_accounts_trades
+from src.logger import logger
+from src.plotting import plot_detailed_pnl_chart, plot_aggregated_pnl_chart
+from src.utils import get_period_start
+
+
+def parse_end(value):
+    """Come datetime.fromisoformat, ma una data senza orario indica la fine di quel giorno"""
+    end_time = datetime.fromisoformat(value)
+    if len(value) == len('YYYY-MM-DD'):
+        end_time += timedelta(days=1) - timedelta(microseconds=1)
+    return end_time
+
+
+def build_account_report(account, start_time, end_time, period, timeframe, output_dir):
+    """
+    Crea il report di un singolo account: grafici HTML, tabella aggregata CSV e riepilogo JSON.
+    Viene generato un report per ogni categoria, perché il PNL dei contratti linear (USDT)
+    e quello degli inverse (moneta base) non possono essere sommati.
+
+    :param start_time: Inizio del periodo (None per tutti i dati)
+    :param end_time: Fine del periodo
+    :param period: Etichetta del periodo riportata nel riepilogo (es. '1M' o 'custom')
+    :return: Lista dei riepiloghi dell'account, uno per categoria
+    """
+    summary = {
+        'account': account,
+        'period': period,
+        'timeframe': timeframe,
+        'start_time': start_time.isoformat() if start_time else None,
+        'end_time': end_time.isoformat(),
+    }
+
+    # Il report legge solo i dati locali: DBManager creerebbe un database vuoto
+    if not DBManager.database_path(account).exists():
+        logger.warning(f"No local database for account {account}, skipping report")
+        return [dict(summary, total_trades=0)]
+
+    db = DBManager(account)
+    try:
+        df = db.add_fees_and_funding(db.get_trades(start_time, end_time))
+    finally:
+        db.close()
+
+    if df.empty:
+        logger.warning(f"No trades for account {account} from {start_time} to {end_time}, skipping report")
+        return [dict(summary, total_trades=0)]
+
+    return [
+        build_category_report(account, category, df[df['category'] == category], dict(summary, category=category),
+                              timeframe, Path(output_dir) / db.account / category)
+        for category in sorted(df['category'].unique())
+    ]
+
+
+def build_category_report(account, category, df, summary, timeframe, report_dir):
+    """
+    Scrive grafici, tabella aggregata e riepilogo dei trades di una categoria di un account
+
+    :return: Dizionario con il riepilogo
+    """
+    report_dir.mkdir(parents=True, exist_ok=True)
+
+    summary.update({
+        'total_pnl': float(df['closedPnl'].sum()),
+        'total_trades': int(len(df)),
+        'win_rate': float((df['closedPnl'] > 0).mean() * 100),
+        'avg_pnl': float(df['closedPnl'].mean()),
+    })
+    if 'net_pnl' in df.columns:
+        summary.update({
+            'gross_pnl': float(df['gross_pnl'].sum()),
+            'fees': float(df['fees'].sum()),
+            'funding': float(df['funding'].sum()),
+            'net_pnl': float(df['net_pnl'].sum()),
+        })
+
+    # Tabella aggregata, come nella sezione "Aggregated Data" della dashboard
+    aggregated = BybitClient.aggregate_pnl(df, timeframe)
+    aggregated.to_csv(report_dir / f"aggregated_{timeframe}.csv", index=False)
+
+    # Grafici statici; plotly.js viene caricato da CDN per mantenere i file leggeri
+    title = f"{account} {category}"
+    df_plot = df.sort_values('updatedTime').set_index('updatedTime')
+    plot_aggregated_pnl_chart(df_plot, timeframe, f"{title} - PNL Analysis ({timeframe})").write_html(
+        report_dir / f"aggregated_{timeframe}.html", include_plotlyjs='cdn'
+    )
+    plot_detailed_pnl_chart(df_plot, f"{title} - PNL Analysis").write_html(
+        report_dir / "detailed.html", include_plotlyjs='cdn'
+    )
+
+    (report_dir / "summary.json").write_text(json.dumps(summary, indent=2))
+    logger.info(f"Report for account {account}, category {category} written to {report_dir}")
+    return summary
+
+
+def build_reports(accounts, start_time, end_time, period, timeframe, output_dir, workers=None):
+    """
+    Genera i report di tutti gli account in parallelo su più processi
+    e scrive il riepilogo complessivo in summary.json e summary.csv
+
+    :return: Lista dei riepiloghi per account e categoria
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    summaries = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            account: executor.submit(build_account_report, account, start_time, end_time, period, timeframe, output_dir)
+            for account in accounts
+        }
+        for account, future in futures.items():
+            try:
+                summaries.extend(future.result())
+            except Exception as e:
+                logger.error(f"Error building report for account {account}: {str(e)}")
+                summaries.append({'account': account, 'error': str(e)})
+
+    (output_dir / "summary.json").write_text(json.dumps(summaries, indent=2))
+    pd.DataFrame(summaries).to_csv(output_dir / "summary.csv", index=False)
+    return summaries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate static PNL reports for all configured accounts")
+    parser.add_argument("--period", choices=config.SUPPORTED_PERIODS,
+                        help=f"Preset period (default: {config.DEFAULT_PERIOD})")
+    parser.add_argument("--start", type=datetime.fromisoformat,
+                        help="Start of a custom period, ISO format (e.g. 2024-01-01)")
+    parser.add_argument("--end", type=parse_end,
+                        help="End of a custom period, ISO format; a date includes the whole day (default: now)")
+    parser.add_argument("--timeframe", choices=config.SUPPORTED_TIMEFRAMES, default=config.DEFAULT_TIMEFRAME)
+    parser.add_argument("--accounts", nargs="+", help="Accounts to include (default: all configured accounts)")
+    parser.add_argument("--output", default="reports", help="Output directory (default: reports)")
+    parser.add_argument("--workers", type=int, help="Number of worker processes (default: CPU count)")
+    parser.add_argument("--export", type=Path,
+                        help="Also export the trades of all accounts in the period to one .csv or .parquet file")
+    args = parser.parse_args()
+
+    if args.period and (args.start or args.end):
+        parser.error("--period cannot be combined with --start/--end")
+    if args.start or args.end:
+        period = 'custom'
+        end_time = args.end or datetime.now()
+        start_time = args.start
+        if start_time and start_time >= end_time:
+            parser.error("--start must be before --end")
+    else:
+        period = args.period or config.DEFAULT_PERIOD
+        end_time = datetime.now()
+        start_time = get_period_start(period, end_time)
+
+    export_format = args.export.suffix.lstrip('.').lower() if args.export else None
+    if export_format not in (None, 'csv', 'parquet'):
+        parser.error("--export must be a .csv or .parquet file")
+
+    accounts = args.accounts or BybitClient.get_available_accounts()
+    summaries = build_reports(accounts, start_time, end_time, period, args.timeframe, args.output, args.workers)
+    if args.export:
+        # I trades vengono letti e scritti a blocchi: la memoria usata non dipende dal periodo
+        export_accounts_trades(accounts, args.export, export_format, start_time, end_time)
+    failed = [s['account'] for s in summaries if 'error' in s]
+    logger.info(f"Generated reports for {len(accounts) - len(failed)} of {len(accounts)} accounts in {args.output}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,208 @@
+import asyncio
+import hashlib
+import hmac
+import time
+from datetime import datetime, timedelta
+
+import aiohttp
+from yarl import URL
+
+from . import config
+from .bybit_client import BaseBybitClient
+from .logger import logger
+
+
+class AsyncBybitClient(BaseBybitClient):
+    """
+    Variante asincrona di BybitClient basata su aiohttp, per i soli PNL chiusi.
+
+    Usa una sessione con connessioni keep-alive condivise e limita le richieste
+    contemporanee con un semaforo. Va usato come context manager asincrono:
+
+        async with AsyncBybitClient('Main') as client:
+            df = await client.get_pnl_dataframe(start_time, end_time)
+    """
+
+    CLOSED_PNL_PATH = "/v5/position/closed-pnl"
+
+    def __init__(self, account_name='Main', base_url=None, max_concurrency=None, semaphore=None):
+        """
+        Inizializza il client asincrono con le credenziali dell'account specificato
+
+        :param account_name: Nome dell'account da utilizzare (default: 'Main')
+        :param base_url: Endpoint REST da usare (default: config.BYBIT_API_URL)
+        :param max_concurrency: Numero massimo di richieste contemporanee (default: config.MAX_CONCURRENT_REQUESTS)
+        :param semaphore: Semaforo condiviso tra più client per limitare le richieste complessive
+        """
+        super().__init__(account_name)
+        account = config.BYBIT_SUBACCOUNTS[account_name]
+        self.api_key = account['api_key']
+        self.api_secret = account['api_secret']
+        self.base_url = (base_url or config.BYBIT_API_URL).rstrip('/')
+        self.max_concurrency = max_concurrency or config.MAX_CONCURRENT_REQUESTS
+        self.semaphore = semaphore or asyncio.Semaphore(self.max_concurrency)
+        self.session = None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def open(self):
+        """Crea la sessione HTTP con il pool di connessioni keep-alive"""
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency, keepalive_timeout=30)
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=30)
+            )
+
+    async def close(self):
+        """Chiude la sessione HTTP e le connessioni del pool"""
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+        self.session = None
+
+    def _sign(self, query_string, timestamp):
+        """
+        Calcola la firma HMAC-SHA256 richiesta dalle API Bybit v5
+
+        :param query_string: Query string della richiesta GET
+        :param timestamp: Timestamp in millisecondi usato nell'header X-BAPI-TIMESTAMP
+        """
+        payload = f"{timestamp}{self.api_key}{config.RECV_WINDOW}{query_string}"
+        return hmac.new(
+            self.api_secret.encode("utf-8"),
+            payload.encode("utf-8"),
+            hashlib.sha256
+        ).hexdigest()
+
+    async def _get(self, path, params):
+        """
+        Esegue una GET autenticata e restituisce il campo 'result' della risposta
+
+        :param path: Path dell'endpoint (es. /v5/position/closed-pnl)
+        :param params: Parametri della query
+        """
+        if self.session is None:
+            await self.open()
+
+        # Stessa serializzazione usata da pybit: la firma deve coincidere con la query inviata
+        query_string = "&".join(f"{key}={value}" for key, value in params.items())
+
+        async with self.semaphore:
+            await self.rate_limiter.acquire_async()
+            # Firma calcolata solo al momento dell'invio: le richieste in coda possono attendere
+            # più di RECV_WINDOW e verrebbero rifiutate da Bybit (retCode 10002)
+            timestamp = int(time.time() * 1000)
+            headers = {
+                "X-BAPI-API-KEY": self.api_key,
+                "X-BAPI-SIGN": self._sign(query_string, timestamp),
+                "X-BAPI-SIGN-TYPE": "2",
+                "X-BAPI-TIMESTAMP": str(timestamp),
+                "X-BAPI-RECV-WINDOW": str(config.RECV_WINDOW),
+            }
+            async with self.session.get(URL(f"{self.base_url}{path}?{query_string}", encoded=True), headers=headers) as response:
+                response.raise_for_status()
+                body = await response.json(content_type=None)
+
+        if body.get("retCode") != 0:
+            raise RuntimeError(f"Bybit error {body.get('retCode')}: {body.get('retMsg')}")
+        return body["result"]
+
+    async def get_closed_pnl(self, category=config.DEFAULT_CATEGORY, limit=100, cursor=None, start_time=None, end_time=None, symbol=None):
+        """
+        Recupera i PNL chiusi con i parametri specificati
+        """
+        params = self._page_params({"category": category, "limit": limit}, cursor, start_time, end_time, symbol)
+        return await self._get(self.CLOSED_PNL_PATH, params)
+
+    async def _get_interval_pnl(self, category, interval_start, interval_end, symbol=None):
+        """Recupera tutte le pagine di PNL chiusi di una categoria per un singolo intervallo"""
+        logger.info(f"Fetching {category} data for account {self.account_name} from {interval_start} to {interval_end}")
+
+        interval_pnl = []
+        cursor = None
+        while True:
+            result = await self.get_closed_pnl(
+                category=category,
+                cursor=cursor,
+                start_time=interval_start,
+                end_time=interval_end,
+                symbol=symbol
+            )
+
+            if not result["list"]:
+                break
+
+            interval_pnl.extend(dict(trade, category=category) for trade in result["list"])
+            logger.info(f"Retrieved {len(result['list'])} {category} trades for account {self.account_name}")
+
+            cursor = result.get("nextPageCursor")
+            if not cursor:
+                break
+
+        return interval_pnl
+
+    async def get_all_closed_pnl(self, start_time=None, end_time=None, symbol=None, categories=None):
+        """
+        Recupera tutti i PNL chiusi dal periodo specificato, scaricando categorie e intervalli in parallelo.
+        Se non viene specificato un periodo, cerca di recuperare l'ultimo anno di dati.
+
+        :param categories: Categorie da scaricare (default: config.BYBIT_CATEGORIES)
+        """
+        if not end_time:
+            end_time = datetime.now()
+        if not start_time:
+            start_time = end_time - timedelta(days=365)
+        if not categories:
+            categories = config.BYBIT_CATEGORIES
+
+        logger.info(f"Starting data retrieval for account {self.account_name}, from {start_time} to {end_time}, categories {categories}")
+
+        date_intervals = self._get_date_intervals(start_time, end_time, days=6)
+        requests = [(category, interval_start, interval_end)
+                    for category in categories
+                    for interval_start, interval_end in date_intervals]
+        results = await asyncio.gather(
+            *(self._get_interval_pnl(category, interval_start, interval_end, symbol)
+              for category, interval_start, interval_end in requests),
+            return_exceptions=True
+        )
+
+        # Mantiene l'ordine per categoria e intervallo come nella versione sincrona
+        all_pnl = []
+        for (category, interval_start, interval_end), result in zip(requests, results):
+            if isinstance(result, Exception):
+                logger.error(f"Error retrieving {category} data for account {self.account_name}, period {interval_start} - {interval_end}: {str(result)}")
+                continue
+            all_pnl.extend(result)
+
+        logger.info(f"Total trades retrieved for account {self.account_name}: {len(all_pnl)}")
+        return all_pnl
+
+    async def get_pnl_dataframe(self, start_time=None, end_time=None, symbol=None, categories=None):
+        """
+        Recupera i PNL come DataFrame pandas
+        """
+        pnl_data = await self.get_all_closed_pnl(start_time, end_time, symbol, categories)
+        return self._build_dataframe(pnl_data)
+
+
+async def get_accounts_pnl_dataframes(account_names, start_time=None, end_time=None, max_concurrency=None):
+    """
+    Recupera i PNL di più account nello stesso event loop, condividendo il limite di richieste contemporanee
+
+    :param account_names: Lista dei nomi degli account
+    :return: Dizionario {account: DataFrame}
+    """
+    semaphore = asyncio.Semaphore(max_concurrency or config.MAX_CONCURRENT_REQUESTS)
+
+    async def fetch(account_name):
+        async with AsyncBybitClient(account_name, max_concurrency=max_concurrency, semaphore=semaphore) as client:
+            return await client.get_pnl_dataframe(start_time, end_time)
+
+    frames = await asyncio.gather(*(fetch(name) for name in account_names))
+    return dict(zip(account_names, frames))
@@ -1,33 +1,62 @@
-from pybit.unified_trading import HTTP
 import pandas as pd
 import numpy as np
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from operator import itemgetter
 from . import config
 from .logger import logger
+from .rate_limiter import RateLimiter
+
+# Colonne dei record closed PnL convertite nel loro dtype numerico da _build_dataframe
+PNL_FLOAT_COLUMNS = ['closedSize', 'cumEntryValue', 'avgEntryPrice', 'avgExitPrice', 'closedPnl']
+PNL_INT_COLUMNS = ['createdTime', 'updatedTime', 'fillCount']
+# Valute di regolamento dei contratti linear: l'elenco delle posizioni linear va richiesto per valuta
+LINEAR_SETTLE_COINS = ['USDT', 'USDC']
+
+class BaseBybitClient:
+    """
+    Parte comune ai client sincrono e asincrono: account, intervalli di date,
+    normalizzazione dei record closed PnL e aggregazione. Non esegue richieste HTTP.
+    """
 
-class BybitClient:
     def __init__(self, account_name='Main'):
         """
-        Inizializza il client Bybit con le credenziali dell'account specificato
+        Inizializza il client con l'account specificato
         
         :param account_name: Nome dell'account da utilizzare (default: 'Main')
         """
         if account_name not in config.BYBIT_SUBACCOUNTS:
             raise ValueError(f"Account '{account_name}' non trovato nella configurazione")
             
-        account = config.BYBIT_SUBACCOUNTS[account_name]
         self.account_name = account_name
-        self.client = HTTP(
-            api_key=account['api_key'],
-            api_secret=account['api_secret'],
-            testnet=False
-        )
+        # Budget di richieste condiviso tra le categorie scaricate in parallelo
+        self.rate_limiter = RateLimiter(config.API_RATE_LIMIT)
 
     @classmethod
     def get_available_accounts(cls):
         """Restituisce la lista degli account configurati"""
         return list(config.BYBIT_SUBACCOUNTS.keys())
 
+    @staticmethod
+    def _page_params(params, cursor=None, start_time=None, end_time=None, symbol=None):
+        """
+        Aggiunge ai parametri di un endpoint paginato cursore, intervallo temporale e symbol, se indicati
+
+        :param params: Parametri specifici dell'endpoint (es. category e limit)
+        :return: Dizionario dei parametri della richiesta
+        """
+        params = dict(params)
+        if cursor:
+            params["cursor"] = cursor
+        if start_time:
+            params["startTime"] = int(start_time.timestamp() * 1000)
+        if end_time:
+            params["endTime"] = int(end_time.timestamp() * 1000)
+        if symbol:
+            params["symbol"] = symbol
+        return params
+
     def _get_date_intervals(self, start_time, end_time, days=6):
         """
         Genera intervalli di N giorni tra start_time e end_time.
@@ -57,44 +86,300 @@ class BybitClient:
             
         return intervals
 
-    def get_closed_pnl(self, category="linear", limit=100, cursor=None, start_time=None, end_time=None, symbol=None):
+    def _build_dataframe(self, pnl_data):
         """
-        Recupera i PNL chiusi con i parametri specificati
+        Converte la lista di record closed PnL restituita da Bybit in un DataFrame normalizzato.
+        Ogni colonna viene estratta dai record una sola volta e convertita direttamente nel suo
+        dtype finale (float64, int64, datetime64), senza passare da un DataFrame di stringhe.
+        
+        :param pnl_data: Lista di record come restituiti dall'endpoint closed-pnl
         """
-        params = {
-            "category": category,
-            "limit": limit
-        }
+        if not pnl_data:
+            return pd.DataFrame()
         
-        if cursor:
-            params["cursor"] = cursor
-        if start_time:
-            params["startTime"] = int(start_time.timestamp() * 1000)
-        if end_time:
-            params["endTime"] = int(end_time.timestamp() * 1000)
+        data = {}
+        for col in pnl_data[0]:
+            if col in PNL_FLOAT_COLUMNS:
+                data[col] = self._to_numeric_column(pnl_data, col, float, np.float64)
+            elif col in PNL_INT_COLUMNS:
+                data[col] = self._to_numeric_column(pnl_data, col, int, np.int64)
+            else:
+                data[col] = self._to_object_column(pnl_data, col)
+        
+        # Timestamp in millisecondi convertiti a datetime senza passare da pd.to_datetime
+        for col in ('createdTime', 'updatedTime'):
+            data[col] = data[col].astype('datetime64[ms]').astype('datetime64[ns]')
+        
+        # Correggiamo il side: Sell -> Buy, Buy -> Sell
+        data['side'] = np.where(data['side'] == 'Sell', 'Buy', 'Sell').astype(object)
+        
+        # Calcola il capitale investito: per i contratti inverse la size è in USD
+        # e il PnL è nella moneta base, quindi il capitale è size / prezzo
+        if 'category' not in data:
+            data['category'] = self._to_object_column(pnl_data, 'category')
+        size, entry_price = data['closedSize'], data['avgEntryPrice']
+        with np.errstate(divide='ignore', invalid='ignore'):
+            invested_capital = size * entry_price
+            inverse = data['category'] == 'inverse'
+            if inverse.any():
+                invested_capital[inverse] = size[inverse] / entry_price[inverse]
+            
+            # Calcola la percentuale di guadagno/perdita sul capitale investito
+            pct = data['closedPnl'] / invested_capital
+        pct *= 100
+        data['invested_capital'] = invested_capital
+        data['pct'] = np.round(pct, 2, out=pct)
+        
+        df = pd.DataFrame(data, copy=False)
+        logger.info(f"Created DataFrame with {len(df)} trades for account {self.account_name}")
+        return df
+
+    @staticmethod
+    def _to_numeric_column(records, column, parse, dtype):
+        """
+        Estrae una colonna numerica dai record convertendola direttamente in un array di tipo dtype.
+        Se un valore manca o non è convertibile ripiega su pd.to_numeric(errors='coerce').
+        """
+        try:
+            return np.fromiter(map(parse, map(itemgetter(column), records)), dtype, len(records))
+        except (KeyError, TypeError, ValueError):
+            values = pd.to_numeric(pd.Series([record.get(column) for record in records]), errors='coerce')
+            return values.to_numpy(dtype=np.float64 if values.hasnans else dtype)
+
+    @staticmethod
+    def _to_object_column(records, column):
+        """Estrae una colonna di testo dai record; i valori mancanti diventano None (category: default)"""
+        values = np.empty(len(records), dtype=object)
+        try:
+            values[:] = list(map(itemgetter(column), records))
+        except KeyError:
+            default = config.DEFAULT_CATEGORY if column == 'category' else None
+            values[:] = [record.get(column, default) for record in records]
+        return values
+
+    @staticmethod
+    def aggregate_pnl(df, timeframe='1d', symbol=None):
+        """
+        Aggrega i PNL per il timeframe specificato.
+        I trades devono appartenere a una sola categoria: il closedPnl dei contratti linear è in USDT,
+        quello degli inverse nella moneta base, quindi le somme non avrebbero un'unità comune.
+        """
+        if df.empty:
+            return pd.DataFrame()
+
+        if 'category' in df.columns and df['category'].nunique() > 1:
+            raise ValueError(f"Cannot aggregate PNL across categories {sorted(df['category'].unique())}: filter by category first")
+            
+        # Imposta l'indice temporale
+        df = df.set_index('updatedTime')
+        
+        # Filtra per symbol se specificato
         if symbol:
-            params["symbol"] = symbol
+            df = df[df['symbol'] == symbol]
+            
+        # Definisci il periodo di resampling
+        resample_map = {
+            '1d': 'D',
+            '1w': 'W',
+            '1M': 'M'
+        }
+        
+        period = resample_map.get(timeframe, 'D')
+        
+        # Funzione per calcolare la media ponderata del PNL
+        def weighted_pnl_pct(group):
+            total_invested = group['invested_capital'].sum()
+            if total_invested == 0:
+                return 0
+            weighted_pct = (group['closedPnl'].sum() / total_invested * 100)
+            return weighted_pct
+            
+        # Calcola durate
+        df['duration'] = (df.index - df['createdTime']).dt.total_seconds() / 60
+
+        # Funzioni di aggregazione per le durate
+        def total_duration(durations):
+            return durations.sum()
+            
+        def avg_duration(durations):
+            return durations.mean()
+        
+        # Aggrega i dati
+        aggregated = df.resample(period).agg({
+            'closedPnl': 'sum',
+            'fillCount': 'sum',
+            'symbol': 'count',  # numero di trades
+            'duration': [total_duration, avg_duration]  # durate totali e medie
+        })
+        
+        # Appiattisci i livelli delle colonne
+        aggregated.columns = ['closedPnl', 'fillCount', 'trades', 'duration_total', 'duration_avg']
+        
+        # Calcola statistiche aggiuntive
+        aggregated['winRate'] = (df.resample(period)['closedPnl']
+                                .apply(lambda x: (x > 0).mean() * 100))
+                                
+        # Calcola la percentuale sul capitale totale investito nel periodo
+        aggregated['pct'] = (df.resample(period)
+                             .apply(weighted_pnl_pct))
+        aggregated['pct'] = aggregated['pct'].round(2)
+        
+        # Scomposizione lordo/netto se i trades sono arricchiti con fee e funding
+        for col in ['fees', 'funding', 'gross_pnl', 'net_pnl']:
+            if col in df.columns:
+                aggregated[col] = df.resample(period)[col].sum()
+        
+        return aggregated.reset_index()
+
+
+class BybitClient(BaseBybitClient):
+    def __init__(self, account_name='Main'):
+        """
+        Inizializza il client Bybit con le credenziali dell'account specificato
+        
+        :param account_name: Nome dell'account da utilizzare (default: 'Main')
+        """
+        super().__init__(account_name)
+        self._client = None
+        self._client_lock = threading.Lock()
 
+    @property
+    def client(self):
+        """
+        Sessione HTTP pybit, creata alla prima richiesta: importare pybit e aprire la sessione
+        ha un costo che non serve pagare quando la dashboard legge solo i dati locali
+        """
+        with self._client_lock:
+            if self._client is None:
+                from pybit.unified_trading import HTTP
+
+                account = config.BYBIT_SUBACCOUNTS[self.account_name]
+                self._client = HTTP(
+                    api_key=account['api_key'],
+                    api_secret=account['api_secret'],
+                    testnet=False
+                )
+            return self._client
+
+    def get_closed_pnl(self, category=config.DEFAULT_CATEGORY, limit=100, cursor=None, start_time=None, end_time=None, symbol=None):
+        """
+        Recupera i PNL chiusi con i parametri specificati
+        """
+        params = self._page_params({"category": category, "limit": limit}, cursor, start_time, end_time, symbol)
+        self.rate_limiter.acquire()
         response = self.client.get_closed_pnl(**params)
         return response["result"]
 
-    def get_all_closed_pnl(self, start_time=None, end_time=None, symbol=None):
+    def get_executions(self, category=config.DEFAULT_CATEGORY, limit=100, cursor=None, start_time=None, end_time=None, symbol=None):
+        """
+        Recupera le esecuzioni (fill) con le relative fee
+        """
+        params = self._page_params({"category": category, "limit": limit}, cursor, start_time, end_time, symbol)
+        self.rate_limiter.acquire()
+        response = self.client.get_executions(**params)
+        return response["result"]
+
+    def get_funding_log(self, category=config.DEFAULT_CATEGORY, limit=50, cursor=None, start_time=None, end_time=None, symbol=None):
+        """
+        Recupera i movimenti di funding (type SETTLEMENT) dal transaction log dell'account unificato.
+        L'endpoint non filtra per symbol: il parametro è accettato solo per uniformità.
+        """
+        params = self._page_params(
+            {"accountType": "UNIFIED", "category": category, "type": "SETTLEMENT", "limit": limit},
+            cursor, start_time, end_time
+        )
+        self.rate_limiter.acquire()
+        response = self.client.get_transaction_log(**params)
+        return response["result"]
+
+    def get_open_positions(self, categories=None):
+        """
+        Recupera le posizioni attualmente aperte (/v5/position/list), marcate con la categoria
+        
+        :param categories: Categorie da interrogare (default: config.BYBIT_CATEGORIES)
+        """
+        positions = []
+        for category in categories or config.BYBIT_CATEGORIES:
+            # Per i contratti linear Bybit richiede symbol o settleCoin
+            settle_coins = LINEAR_SETTLE_COINS if category == 'linear' else [None]
+            for settle_coin in settle_coins:
+                params = {"category": category, "limit": 200}
+                if settle_coin:
+                    params["settleCoin"] = settle_coin
+                
+                cursor = None
+                while True:
+                    if cursor:
+                        params["cursor"] = cursor
+                    self.rate_limiter.acquire()
+                    result = self.client.get_positions(**params)["result"]
+                    positions.extend(dict(position, category=category) for position in result["list"])
+                    cursor = result.get("nextPageCursor")
+                    if not cursor or not result["list"]:
+                        break
+        
+        logger.info(f"Retrieved {len(positions)} open positions for account {self.account_name}")
+        return positions
+
+    def get_all_closed_pnl(self, start_time=None, end_time=None, symbol=None, categories=None):
         """
         Recupera tutti i PNL chiusi dal periodo specificato. 
         Se non viene specificato un periodo, cerca di recuperare l'ultimo anno di dati.
+        Le categorie vengono scaricate in parallelo, condividendo lo stesso limite di richieste.
+        
+        :param categories: Categorie da scaricare (default: config.BYBIT_CATEGORIES)
         """
-        all_pnl = []
+        return self._get_all_records(self.get_closed_pnl, "trades", start_time, end_time, symbol, categories)
+
+    def get_all_executions(self, start_time=None, end_time=None, symbol=None, categories=None):
+        """
+        Recupera tutte le esecuzioni del periodo, con gli stessi intervalli usati per i PNL chiusi
+        """
+        return self._get_all_records(self.get_executions, "executions", start_time, end_time, symbol, categories)
+
+    def get_all_funding(self, start_time=None, end_time=None, categories=None):
+        """
+        Recupera tutti i movimenti di funding del periodo, con gli stessi intervalli usati per i PNL chiusi
+        """
+        return self._get_all_records(self.get_funding_log, "funding entries", start_time, end_time, None, categories)
+
+    def _get_all_records(self, fetch_page, label, start_time=None, end_time=None, symbol=None, categories=None):
+        """
+        Scarica tutte le pagine di un endpoint paginato per finestre di 7 giorni,
+        eseguendo le categorie in parallelo con lo stesso limite di richieste.
         
+        :param fetch_page: Metodo che recupera una singola pagina (es. self.get_closed_pnl)
+        :param label: Descrizione dei record usata nei log
+        """
         # Se non sono specificate le date, prova a recuperare l'ultimo anno
         if not end_time:
             end_time = datetime.now()
         if not start_time:
             start_time = end_time - timedelta(days=365)
+        if not categories:
+            categories = config.BYBIT_CATEGORIES
             
-        logger.info(f"Starting data retrieval for account {self.account_name}, from {start_time} to {end_time}")
+        logger.info(f"Starting {label} retrieval for account {self.account_name}, from {start_time} to {end_time}, categories {categories}")
         
         # Ottieni gli intervalli di 6 giorni (che diventano 7 quando convertiti in timestamp)
         date_intervals = self._get_date_intervals(start_time, end_time, days=6)
+        
+        with ThreadPoolExecutor(max_workers=len(categories)) as executor:
+            results = executor.map(
+                lambda category: self._get_category_records(fetch_page, label, category, date_intervals, symbol),
+                categories
+            )
+            all_records = [record for category_records in results for record in category_records]
+                
+        logger.info(f"Total {label} retrieved for account {self.account_name}: {len(all_records)}")
+        return all_records
+
+    def _get_category_records(self, fetch_page, label, category, date_intervals, symbol=None):
+        """
+        Recupera i record di una singola categoria per gli intervalli indicati.
+        Ogni record viene marcato con la categoria di provenienza.
+        """
+        category_records = []
         error_count = 0
         max_errors = 3
         
@@ -111,16 +396,17 @@ class BybitClient:
             tried_intervals.add(interval_key)
             
             if error_count >= max_errors:
-                logger.error(f"Too many consecutive errors ({max_errors}), stopping data retrieval")
+                logger.error(f"Too many consecutive errors ({max_errors}) for category {category}, stopping data retrieval")
                 break
                 
             try:
-                logger.info(f"Fetching data for account {self.account_name} from {interval_start} to {interval_end}")
+                logger.info(f"Fetching {category} {label} for account {self.account_name} from {interval_start} to {interval_end}")
                 
                 # Recupera i dati per questo intervallo con paginazione
                 cursor = None
                 while True:
-                    result = self.get_closed_pnl(
+                    result = fetch_page(
+                        category=category,
                         cursor=cursor,
                         start_time=interval_start,
                         end_time=interval_end,
@@ -130,9 +416,9 @@ class BybitClient:
                     if not result["list"]:
                         break
                         
-                    trades_count = len(result["list"])
-                    all_pnl.extend(result["list"])
-                    logger.info(f"Retrieved {trades_count} trades for account {self.account_name}")
+                    records_count = len(result["list"])
+                    category_records.extend(dict(record, category=category) for record in result["list"])
+                    logger.info(f"Retrieved {records_count} {category} {label} for account {self.account_name}")
                     
                     cursor = result.get("nextPageCursor")
                     if not cursor:
@@ -143,106 +429,50 @@ class BybitClient:
                 
             except Exception as e:
                 error_count += 1
-                logger.error(f"Error retrieving data for account {self.account_name}, period {interval_start} - {interval_end}: {str(e)}")
+                logger.error(f"Error retrieving {category} {label} for account {self.account_name}, period {interval_start} - {interval_end}: {str(e)}")
                 
-        logger.info(f"Total trades retrieved for account {self.account_name}: {len(all_pnl)}")
-        return all_pnl
+        return category_records
 
-    def get_pnl_dataframe(self, start_time=None, end_time=None, symbol=None):
+    def get_pnl_dataframe(self, start_time=None, end_time=None, symbol=None, categories=None):
         """
         Recupera i PNL come DataFrame pandas
         """
-        pnl_data = self.get_all_closed_pnl(start_time, end_time, symbol)
-        
-        df = pd.DataFrame(pnl_data)
-        if not df.empty:
-            # Converti prima in numerico per evitare il warning
-            df['createdTime'] = pd.to_numeric(df['createdTime'])
-            df['updatedTime'] = pd.to_numeric(df['updatedTime'])
-            
-            # Poi converti in datetime
-            df['createdTime'] = pd.to_datetime(df['createdTime'], unit='ms')
-            df['updatedTime'] = pd.to_datetime(df['updatedTime'], unit='ms')
-            
-            # Converti le colonne numeriche
-            numeric_columns = ['closedSize', 'cumEntryValue', 'avgEntryPrice', 
-                             'avgExitPrice', 'closedPnl', 'fillCount']
-            for col in numeric_columns:
-                if col in df.columns:
-                    df[col] = pd.to_numeric(df[col], errors='coerce')
-            
-            # Correggiamo il side: Sell -> Buy, Buy -> Sell
-            df['side'] = np.where(df['side'] == 'Sell', 'Buy', 'Sell')
-            
-            # Calcola il capitale investito
-            df['invested_capital'] = df['closedSize'] * df['avgEntryPrice']
-            
-            # Calcola la percentuale di guadagno/perdita sul capitale investito
-            df['pct'] = (df['closedPnl'] / df['invested_capital'] * 100).round(2)
-            
-            logger.info(f"Created DataFrame with {len(df)} trades for account {self.account_name}")
-                    
-        return df
+        pnl_data = self.get_all_closed_pnl(start_time, end_time, symbol, categories)
+        return self._build_dataframe(pnl_data)
 
-    def aggregate_pnl(self, df, timeframe='1d', symbol=None):
+    def get_executions_dataframe(self, start_time=None, end_time=None, symbol=None, categories=None):
         """
-        Aggrega i PNL per il timeframe specificato
+        Recupera le esecuzioni di trading come DataFrame, con le sole colonne usate per attribuire le fee
         """
+        columns = ['execId', 'orderId', 'symbol', 'category', 'side', 'execType',
+                   'execTime', 'execPrice', 'execQty', 'execFee']
+        df = pd.DataFrame(self.get_all_executions(start_time, end_time, symbol, categories))
         if df.empty:
-            return pd.DataFrame()
-            
-        # Imposta l'indice temporale
-        df = df.set_index('updatedTime')
-        
-        # Filtra per symbol se specificato
-        if symbol:
-            df = df[df['symbol'] == symbol]
-            
-        # Definisci il periodo di resampling
-        resample_map = {
-            '1d': 'D',
-            '1w': 'W',
-            '1M': 'M'
-        }
+            return pd.DataFrame(columns=columns)
         
-        period = resample_map.get(timeframe, 'D')
+        df = df.reindex(columns=columns)
+        # Il funding compare anche tra le esecuzioni: viene preso dal transaction log
+        df = df[df['execType'] != 'Funding']
+        df['execTime'] = pd.to_datetime(pd.to_numeric(df['execTime']), unit='ms')
+        for col in ['execPrice', 'execQty', 'execFee']:
+            df[col] = pd.to_numeric(df[col], errors='coerce')
         
-        # Funzione per calcolare la media ponderata del PNL
-        def weighted_pnl_pct(group):
-            total_invested = (group['closedSize'] * group['avgEntryPrice']).sum()
-            if total_invested == 0:
-                return 0
-            weighted_pct = (group['closedPnl'].sum() / total_invested * 100)
-            return weighted_pct
-            
-        # Calcola durate
-        df['duration'] = (df.index - df['createdTime']).dt.total_seconds() / 60
+        logger.info(f"Created executions DataFrame with {len(df)} rows for account {self.account_name}")
+        return df
 
-        # Funzioni di aggregazione per le durate
-        def total_duration(durations):
-            return durations.sum()
-            
-        def avg_duration(durations):
-            return durations.mean()
-        
-        # Aggrega i dati
-        aggregated = df.resample(period).agg({
-            'closedPnl': 'sum',
-            'fillCount': 'sum',
-            'symbol': 'count',  # numero di trades
-            'duration': [total_duration, avg_duration]  # durate totali e medie
-        })
-        
-        # Appiattisci i livelli delle colonne
-        aggregated.columns = ['closedPnl', 'fillCount', 'trades', 'duration_total', 'duration_avg']
+    def get_funding_dataframe(self, start_time=None, end_time=None, categories=None):
+        """
+        Recupera i pagamenti di funding come DataFrame.
+        La colonna funding è la variazione di saldo (change): positiva se incassato, negativa se pagato.
+        """
+        columns = ['id', 'symbol', 'category', 'transactionTime', 'funding']
+        df = pd.DataFrame(self.get_all_funding(start_time, end_time, categories))
+        if df.empty:
+            return pd.DataFrame(columns=columns)
         
-        # Calcola statistiche aggiuntive
-        aggregated['winRate'] = (df.resample(period)['closedPnl']
-                                .apply(lambda x: (x > 0).mean() * 100))
-                                
-        # Calcola la percentuale sul capitale totale investito nel periodo
-        aggregated['pct'] = (df.resample(period)
-                             .apply(weighted_pnl_pct))
-        aggregated['pct'] = aggregated['pct'].round(2)
+        df['funding'] = pd.to_numeric(df['change'], errors='coerce')
+        df = df.reindex(columns=columns)
+        df['transactionTime'] = pd.to_datetime(pd.to_numeric(df['transactionTime']), unit='ms')
         
-        return aggregated.reset_index()
\ No newline at end of file
+        logger.info(f"Created funding DataFrame with {len(df)} rows for account {self.account_name}")
+        return df
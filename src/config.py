@@ -1,37 +1,99 @@
 import os
-from dotenv import load_dotenv
+from functools import lru_cache
 
-# Carica le variabili d'ambiente dal file .env
-load_dotenv()
 
-# Dizionario per mappare gli account
-BYBIT_SUBACCOUNTS = {}
+@lru_cache(maxsize=None)
+def load_settings():
+    """
+    Legge .env e le variabili d'ambiente alla prima richiesta invece che all'import del modulo.
+    Il risultato viene memorizzato: le letture successive non riscansionano l'ambiente.
+    """
+    from dotenv import load_dotenv
 
-# Controlla prima se esistono variabili per subaccount
-env_vars = dict(os.environ)
-api_keys = [k for k in env_vars if k.startswith('BYBIT_API_KEY_')]
-accounts = [k.replace('BYBIT_API_KEY_', '') for k in api_keys]
+    # Carica le variabili d'ambiente dal file .env
+    load_dotenv()
 
-# Se non ci sono subaccount configurati, usa il main account
-if not accounts and os.getenv('BYBIT_API_KEY'):
-    BYBIT_SUBACCOUNTS['Main'] = {
-        'api_key': os.getenv('BYBIT_API_KEY'),
-        'api_secret': os.getenv('BYBIT_API_SECRET')
+    # Dizionario per mappare gli account
+    subaccounts = {}
+
+    # Controlla prima se esistono variabili per subaccount
+    env_vars = dict(os.environ)
+    api_keys = [k for k in env_vars if k.startswith('BYBIT_API_KEY_')]
+    accounts = [k.replace('BYBIT_API_KEY_', '') for k in api_keys]
+
+    # Se non ci sono subaccount configurati, usa il main account
+    if not accounts and os.getenv('BYBIT_API_KEY'):
+        subaccounts['Main'] = {
+            'api_key': os.getenv('BYBIT_API_KEY'),
+            'api_secret': os.getenv('BYBIT_API_SECRET')
+        }
+    else:
+        # Carica le configurazioni per ogni account rilevato
+        for account in accounts:
+            api_key = os.getenv(f'BYBIT_API_KEY_{account}')
+            api_secret = os.getenv(f'BYBIT_API_SECRET_{account}')
+            
+            if api_key and api_secret:
+                account_name = account.replace('_', ' ')  # Per una visualizzazione più pulita
+                subaccounts[account_name] = {
+                    'api_key': api_key,
+                    'api_secret': api_secret
+                }
+
+    return {
+        'BYBIT_SUBACCOUNTS': subaccounts,
+        # Categorie da scaricare, configurabili con BYBIT_CATEGORIES=linear,inverse
+        'BYBIT_CATEGORIES': parse_categories(os.getenv('BYBIT_CATEGORIES', ','.join(SUPPORTED_CATEGORIES))),
+        # Scarica anche esecuzioni e funding per la scomposizione PnL lordo/netto
+        'SYNC_FEES_AND_FUNDING': os.getenv('BYBIT_SYNC_FEES_FUNDING', 'true').lower() == 'true',
+        # Backend per filtri e aggregazioni: 'pandas' (default) o 'duckdb'
+        'QUERY_BACKEND': os.getenv('PNL_QUERY_BACKEND', 'pandas').lower(),
     }
-else:
-    # Carica le configurazioni per ogni account rilevato
-    for account in accounts:
-        api_key = os.getenv(f'BYBIT_API_KEY_{account}')
-        api_secret = os.getenv(f'BYBIT_API_SECRET_{account}')
-        
-        if api_key and api_secret:
-            account_name = account.replace('_', ' ')  # Per una visualizzazione più pulita
-            BYBIT_SUBACCOUNTS[account_name] = {
-                'api_key': api_key,
-                'api_secret': api_secret
-            }
+
+
+def parse_categories(value):
+    """
+    Converte BYBIT_CATEGORIES nella lista delle categorie da scaricare.
+    Le categorie non supportate vengono ignorate con un warning; se non ne resta nessuna
+    si usa DEFAULT_CATEGORY, così da non avviare mai uno scaricamento senza categorie.
+
+    :param value: Categorie separate da virgola (es. "linear,inverse")
+    """
+    from .logger import logger
+
+    requested = [c.strip() for c in value.split(',') if c.strip()]
+    categories = [c for c in requested if c in SUPPORTED_CATEGORIES]
+    unsupported = [c for c in requested if c not in SUPPORTED_CATEGORIES]
+    if unsupported:
+        logger.warning(f"Ignoring unsupported BYBIT_CATEGORIES {unsupported}, supported: {SUPPORTED_CATEGORIES}")
+    if not categories:
+        logger.warning(f"No supported category in BYBIT_CATEGORIES, falling back to '{DEFAULT_CATEGORY}'")
+        return [DEFAULT_CATEGORY]
+    return categories
+
+
+def __getattr__(name):
+    """Espone le impostazioni lette dall'ambiente (es. config.BYBIT_SUBACCOUNTS) come attributi del modulo"""
+    if name in ('BYBIT_SUBACCOUNTS', 'BYBIT_CATEGORIES', 'SYNC_FEES_AND_FUNDING', 'QUERY_BACKEND'):
+        return load_settings()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 # Configurazioni aggiuntive
 DEFAULT_TIMEFRAME = '1d'  # Timeframe predefinito per le aggregazioni
 SUPPORTED_TIMEFRAMES = ['1d', '1w', '1M']  # Timeframe supportati
-DEFAULT_CATEGORY = 'linear'  # Categoria predefinita per i contratti
\ No newline at end of file
+DEFAULT_PERIOD = '1M'  # Periodo predefinito per i filtri
+SUPPORTED_PERIODS = ['7D', '1M', '3M', '6M', '1Y', 'YTD', 'All']  # Periodi supportati
+DEFAULT_CATEGORY = 'linear'  # Categoria predefinita per i contratti
+SUPPORTED_CATEGORIES = ['linear', 'inverse']  # Categorie con closed PnL disponibile
+
+# Cartella dei file temporanei delle esportazioni della dashboard (una cartella per sessione, eliminata appena il file è passato al download)
+EXPORT_DIR = 'exports'
+
+# Configurazioni per le richieste HTTP verso Bybit
+BYBIT_API_URL = 'https://api.bybit.com'  # Endpoint REST v5
+BYBIT_WS_PRIVATE_URL = 'wss://stream.bybit.com/v5/private'  # Endpoint WebSocket privato v5
+LIVE_REFRESH_INTERVAL = 2  # Secondi tra i controlli dei nuovi trades live nella dashboard
+RECV_WINDOW = 5000  # Finestra di validità della firma in millisecondi
+MAX_CONCURRENT_REQUESTS = 5  # Richieste contemporanee massime per il client asincrono
+API_RATE_LIMIT = 10  # Richieste al secondo per account, condivise tra tutte le categorie
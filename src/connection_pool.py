@@ -0,0 +1,130 @@
+import atexit
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from .logger import logger
+
+# Connessioni di lettura inattive mantenute aperte per ogni database
+MAX_IDLE_READERS = 8
+# Secondi di attesa quando il database è bloccato da un altro processo
+BUSY_TIMEOUT = 30
+
+
+class ConnectionPool:
+    """
+    Connessioni SQLite condivise da tutti i thread (e quindi da tutte le sessioni Streamlit)
+    del processo per un singolo file di database.
+
+    Usa il journal WAL, in modo che le letture non blocchino le scritture e viceversa:
+    - un'unica connessione di scrittura, usata da un thread alla volta sotto lock
+    - più connessioni in sola lettura, prese in prestito e restituite al pool; ogni prestito
+      è una transazione di lettura, quindi vede un'istantanea coerente del database anche
+      se nel frattempo viene completata una sincronizzazione
+    """
+
+    def __init__(self, db_path, max_idle_readers=MAX_IDLE_READERS):
+        """
+        Inizializza il pool e apre la connessione di scrittura
+
+        :param db_path: Percorso del file SQLite
+        :param max_idle_readers: Numero massimo di connessioni di lettura inattive da mantenere
+        """
+        self.db_path = Path(db_path)
+        self.max_idle_readers = max_idle_readers
+        self._write_lock = threading.RLock()
+        self._readers_lock = threading.Lock()
+        self._idle_readers = []
+
+        self._writer = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT, check_same_thread=False)
+        self._writer.execute("PRAGMA journal_mode=WAL")
+        self._writer.execute("PRAGMA synchronous=NORMAL")
+
+    @contextmanager
+    def writer(self):
+        """
+        Restituisce la connessione di scrittura, riservata al thread corrente per tutta la durata del blocco.
+        Le modifiche non confermate all'uscita dal blocco vengono annullate.
+        """
+        with self._write_lock:
+            try:
+                yield self._writer
+            finally:
+                if self._writer.in_transaction:
+                    self._writer.rollback()
+
+    @contextmanager
+    def reader(self):
+        """
+        Presta una connessione in sola lettura con una transazione aperta:
+        tutte le query eseguite nel blocco leggono la stessa istantanea del database
+        """
+        with self._readers_lock:
+            conn = self._idle_readers.pop() if self._idle_readers else None
+        if conn is None:
+            conn = sqlite3.connect(
+                f"{self.db_path.resolve().as_uri()}?mode=ro",
+                uri=True, timeout=BUSY_TIMEOUT, check_same_thread=False
+            )
+
+        try:
+            conn.execute("BEGIN")
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            with self._readers_lock:
+                if len(self._idle_readers) < self.max_idle_readers:
+                    self._idle_readers.append(conn)
+                    conn = None
+            if conn is not None:
+                conn.close()
+
+    def close(self):
+        """Chiude la connessione di scrittura e le connessioni di lettura inattive"""
+        with self._readers_lock:
+            readers, self._idle_readers = self._idle_readers, []
+        for conn in readers:
+            conn.close()
+        with self._write_lock:
+            self._writer.close()
+        logger.info(f"Closed connection pool for {self.db_path}")
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_connection_pool(db_path, setup=None):
+    """
+    Restituisce il pool del processo per il database indicato, creandolo al primo utilizzo
+
+    :param db_path: Percorso del file SQLite
+    :param setup: Funzione chiamata con la connessione di scrittura solo alla creazione del pool
+                  (es. creazione e migrazione dello schema)
+    """
+    key = Path(db_path).resolve()
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = ConnectionPool(db_path)
+            if setup is not None:
+                try:
+                    with pool.writer() as conn:
+                        setup(conn)
+                except Exception:
+                    pool.close()
+                    raise
+            _pools[key] = pool
+            logger.info(f"Opened connection pool for {db_path}")
+        return pool
+
+
+@atexit.register
+def close_connection_pools():
+    """Chiude tutti i pool aperti dal processo"""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
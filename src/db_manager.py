@@ -1,10 +1,61 @@
-import sqlite3
 import pandas as pd
 from pathlib import Path
+from . import config
+from .connection_pool import get_connection_pool
+from .enrichment import attach_fees_and_funding
 from .logger import logger
 
+# Righe lette dal database per ogni blocco durante le esportazioni
+EXPORT_CHUNK_SIZE = 50000
+
+
+# Tipi dichiarati delle colonne della tabella trades, usati anche per lo schema delle esportazioni Parquet
+TRADES_COLUMNS = {
+    'symbol': 'TEXT',
+    'category': 'TEXT',
+    'side': 'TEXT',
+    'closedSize': 'REAL',
+    'cumEntryValue': 'REAL',
+    'avgEntryPrice': 'REAL',
+    'avgExitPrice': 'REAL',
+    'closedPnl': 'REAL',
+    'fillCount': 'INTEGER',
+    'createdTime': 'TIMESTAMP',
+    'updatedTime': 'TIMESTAMP',
+    'invested_capital': 'REAL',
+    'pct': 'REAL',
+    'trade_duration': 'REAL',
+}
+
+
+def _create_schema(conn):
+    """Crea la tabella trades se non esiste e completa la categoria dei trades salvati prima del supporto multi-categoria"""
+    columns = ",\n            ".join(f"{name} {kind}" for name, kind in TRADES_COLUMNS.items())
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS trades (
+            {columns}
+        )
+    """)
+    if 'category' in [row[1] for row in conn.execute("PRAGMA table_info(trades)")]:
+        _fill_default_category(conn, 'trades')
+    conn.commit()
+
+
+def _fill_default_category(conn, table):
+    """Assegna config.DEFAULT_CATEGORY alle righe senza categoria (salvate quando esistevano solo i contratti linear)"""
+    conn.execute(f"UPDATE {table} SET category = ? WHERE category IS NULL", (config.DEFAULT_CATEGORY,))
+
 
 class DBManager:
+    """
+    Accesso al database SQLite dei trades di un account.
+
+    Le connessioni non appartengono all'istanza ma al pool condiviso dal processo
+    (vedi connection_pool): creare un DBManager a ogni rerun di Streamlit non apre
+    nuove connessioni, le letture usano connessioni in sola lettura e tutte le
+    scritture passano dall'unica connessione di scrittura dell'account.
+    """
+
     def __init__(self, account="main"):
         """
         Inizializza il database manager per uno specifico account
@@ -15,67 +66,124 @@ class DBManager:
         self.account = account.lower().replace(" ", "_")
 
         # Crea la directory data se non esiste
-        data_dir = Path("data")
-        data_dir.mkdir(exist_ok=True)
-
-        # Il path del database sarà data/account_trades.sqlite
-        self.db_path = data_dir / f"{self.account}_trades.sqlite"
-        self.conn = None
+        self.db_path = self.database_path(account)
+        self.db_path.parent.mkdir(exist_ok=True)
+        self.pool = None
         self.connect()
 
+    @staticmethod
+    def database_path(account):
+        """Percorso del database dell'account: data/<account>_trades.sqlite (il file può non esistere ancora)"""
+        return Path("data") / f"{account.lower().replace(' ', '_')}_trades.sqlite"
+
     def connect(self):
-        """Connette al database e crea la tabella se non esiste"""
+        """Recupera il pool di connessioni del database, che al primo utilizzo prepara lo schema"""
         try:
-            self.conn = sqlite3.connect(self.db_path)
-
-            # Crea la tabella trades se non esiste
-            self.conn.execute("""
-                CREATE TABLE IF NOT EXISTS trades (
-                    symbol TEXT,
-                    side TEXT,
-                    closedSize REAL,
-                    cumEntryValue REAL,
-                    avgEntryPrice REAL,
-                    avgExitPrice REAL,
-                    closedPnl REAL,
-                    fillCount INTEGER,
-                    createdTime TIMESTAMP,
-                    updatedTime TIMESTAMP,
-                    invested_capital REAL,
-                    pct REAL,
-                    trade_duration REAL
-                )
-            """)
-            self.conn.commit()
+            self.pool = get_connection_pool(self.db_path, setup=_create_schema)
             logger.info(f"Connected to SQLite database for account {self.account}")
         except Exception as e:
             logger.error(f"Error connecting to database for account {self.account}: {str(e)}")
             raise
 
+    def _prepare_trades(self, df):
+        """Prepara una copia del DataFrame per il salvataggio, calcolando la durata del trade"""
+        df = df.copy()
+
+        # Calcola la durata del trade in minuti se non presente
+        if 'trade_duration' not in df.columns:
+            df['trade_duration'] = (pd.to_datetime(df['updatedTime']) - pd.to_datetime(
+                df['createdTime'])).dt.total_seconds() / 60
+        return df
+
     def save_trades(self, df):
-        """Salva i trades nel database, sostituendo i dati esistenti"""
+        """
+        Salva i trades nel database, sostituendo i dati esistenti.
+        I nuovi dati vengono scritti in una tabella di appoggio che sostituisce trades in un'unica
+        transazione: chi legge durante il salvataggio vede i dati precedenti, mai una tabella vuota.
+        """
         try:
-            # Cancella i dati esistenti
-            self.conn.execute("DELETE FROM trades")
-
             # Prepara il DataFrame per il salvataggio
-            df = df.copy()
+            df = self._prepare_trades(df)
 
-            # Calcola la durata del trade in minuti se non presente
-            if 'trade_duration' not in df.columns:
-                df['trade_duration'] = (pd.to_datetime(df['updatedTime']) - pd.to_datetime(
-                    df['createdTime'])).dt.total_seconds() / 60
+            with self.pool.writer() as conn:
+                # Inserisce i nuovi dati nella tabella di appoggio
+                df.to_sql('trades_staging', conn, if_exists='replace', index=False)
 
-            # Inserisce i nuovi dati
-            df.to_sql('trades', self.conn, if_exists='replace', index=False)
-            self.conn.commit()
+                # Sostituisce i dati esistenti
+                conn.execute("BEGIN IMMEDIATE")
+                conn.execute("DROP TABLE IF EXISTS trades")
+                conn.execute("ALTER TABLE trades_staging RENAME TO trades")
+                conn.commit()
             logger.info(f"Saved {len(df)} trades to database for account {self.account}")
         except Exception as e:
             logger.error(f"Error saving trades to database for account {self.account}: {str(e)}")
             raise
 
-    def get_trades(self, start_time=None, end_time=None):
-        """Recupera i trades dal database con filtri opzionali"""
+    def upsert_trades(self, df, key='orderId'):
+        """
+        Inserisce o aggiorna solo i trades indicati, senza riscrivere l'intera tabella
+
+        :param df: DataFrame con i trades da inserire
+        :param key: Colonna che identifica univocamente un trade (default: 'orderId')
+        """
+        if df.empty:
+            return
+        self._upsert('trades', self._prepare_trades(df), key)
+
+    def save_executions(self, df):
+        """Salva le esecuzioni (fee di trading) nella tabella indicizzata executions"""
+        self._upsert('executions', df, 'execId', time_column='execTime')
+
+    def save_funding(self, df):
+        """Salva i movimenti di funding nella tabella indicizzata funding"""
+        self._upsert('funding', df, 'id', time_column='transactionTime')
+
+    def _upsert(self, table, df, key, time_column=None):
+        """
+        Inserisce o aggiorna le righe di una tabella in base alla colonna chiave
+
+        :param table: Nome della tabella
+        :param df: DataFrame con le righe da inserire
+        :param key: Colonna che identifica univocamente una riga
+        :param time_column: Colonna temporale da indicizzare insieme al symbol per i join
+        """
+        if df.empty:
+            return
+
+        with self.pool.writer() as conn:
+            try:
+                existing_columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+                if existing_columns:
+                    # Allinea lo schema: la tabella può non avere ancora tutte le colonne restituite da Bybit
+                    for column in df.columns:
+                        if column not in existing_columns:
+                            conn.execute(f'ALTER TABLE {table} ADD COLUMN "{column}"')
+                            # Le righe esistenti non hanno categoria: sono trades linear
+                            if column == 'category':
+                                _fill_default_category(conn, table)
+
+                    # Rimuove le versioni precedenti delle stesse righe
+                    conn.executemany(
+                        f'DELETE FROM {table} WHERE "{key}" = ?',
+                        [(value,) for value in df[key].unique()]
+                    )
+
+                # to_sql crea la tabella se non esiste ed esegue il commit insieme alla cancellazione
+                df.to_sql(table, conn, if_exists='append', index=False)
+                conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_{key} ON {table} ("{key}")')
+                if time_column:
+                    conn.execute(
+                        f'CREATE INDEX IF NOT EXISTS idx_{table}_time ON {table} ("{time_column}", symbol)'
+                    )
+                conn.commit()
+                logger.info(f"Upserted {len(df)} rows into {table} for account {self.account}")
+            except Exception as e:
+                conn.rollback()
+                logger.error(f"Error upserting rows into {table} for account {self.account}: {str(e)}")
+                raise
+
+    def _trades_query(self, start_time=None, end_time=None, symbol=None, side=None, category=None):
+        """Costruisce la query sui trades con i filtri opzionali e i relativi parametri"""
         query = "SELECT * FROM trades"
         conditions = []
         params = []
@@ -86,26 +194,230 @@ class DBManager:
         if end_time:
             conditions.append("updatedTime <= ?")
             params.append(end_time.strftime('%Y-%m-%d %H:%M:%S'))
+        if symbol:
+            conditions.append("symbol = ?")
+            params.append(symbol)
+        if side:
+            conditions.append("side = ?")
+            params.append(side)
+        if category:
+            conditions.append("category = ?")
+            params.append(category)
 
         if conditions:
             query += " WHERE " + " AND ".join(conditions)
+        return query, params
+
+    def _normalize_trades(self, df):
+        """Converte le colonne datetime e completa le colonne mancanti nei database meno recenti"""
+        # Converti le colonne datetime usando il formato 'mixed' per maggiore robustezza
+        df['createdTime'] = pd.to_datetime(df['createdTime'], format='mixed')
+        df['updatedTime'] = pd.to_datetime(df['updatedTime'], format='mixed')
+        # I database creati prima del supporto multi-categoria contengono solo trades linear
+        if 'category' not in df.columns:
+            df['category'] = config.DEFAULT_CATEGORY
+        else:
+            df['category'] = df['category'].fillna(config.DEFAULT_CATEGORY)
+        return df
+
+    def get_trades(self, start_time=None, end_time=None, symbol=None, side=None, category=None):
+        """Recupera i trades dal database con filtri opzionali"""
+        query, params = self._trades_query(start_time, end_time, symbol, side, category)
 
         try:
-            df = pd.read_sql_query(query, self.conn, params=params)
-            # Converti le colonne datetime usando il formato 'mixed' per maggiore robustezza
-            df['createdTime'] = pd.to_datetime(df['createdTime'], format='mixed')
-            df['updatedTime'] = pd.to_datetime(df['updatedTime'], format='mixed')
-            return df
+            with self.pool.reader() as conn:
+                df = pd.read_sql_query(query, conn, params=params)
+            return self._normalize_trades(df)
         except Exception as e:
             logger.error(f"Error retrieving trades for account {self.account}: {str(e)}")
             raise
 
+    def iter_trades(self, start_time=None, end_time=None, chunksize=EXPORT_CHUNK_SIZE, **filters):
+        """
+        Restituisce i trades filtrati a blocchi di chunksize righe, senza caricarli tutti in memoria
+
+        :param filters: Filtri opzionali symbol, side e category
+        """
+        query, params = self._trades_query(start_time, end_time, **filters)
+        try:
+            # Tutti i blocchi vengono letti dalla stessa istantanea del database
+            with self.pool.reader() as conn:
+                for chunk in pd.read_sql_query(query, conn, params=params, chunksize=chunksize):
+                    yield self._normalize_trades(chunk)
+        except Exception as e:
+            logger.error(f"Error streaming trades for account {self.account}: {str(e)}")
+            raise
+
+    def export_trades(self, path, fmt='csv', start_time=None, end_time=None, **filters):
+        """
+        Esporta i trades filtrati in un file CSV o Parquet scrivendo un blocco alla volta
+
+        :param path: Percorso del file di destinazione
+        :param fmt: Formato del file ('csv' o 'parquet')
+        :return: Numero di righe esportate
+        """
+        rows = write_chunks(self.iter_trades(start_time, end_time, **filters), path, fmt)
+        logger.info(f"Exported {rows} trades for account {self.account} to {path}")
+        return rows
+
+    def _read_range(self, conn, table, time_column, start_time, end_time):
+        """Legge le righe di una tabella di arricchimento comprese nell'intervallo, ordinate per tempo"""
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone():
+            return pd.DataFrame()
+
+        df = pd.read_sql_query(
+            f'SELECT * FROM {table} WHERE "{time_column}" >= ? AND "{time_column}" <= ? ORDER BY "{time_column}"',
+            conn,
+            params=[start_time.strftime('%Y-%m-%d %H:%M:%S'), end_time.strftime('%Y-%m-%d %H:%M:%S.%f')]
+        )
+        df[time_column] = pd.to_datetime(df[time_column], format='mixed')
+        return df
+
+    def add_fees_and_funding(self, df):
+        """
+        Aggiunge ai trades le colonne fees, funding, gross_pnl e net_pnl.
+        Legge solo le esecuzioni e i funding dell'intervallo coperto dai trades.
+
+        :return: Il DataFrame arricchito, o quello originale se non ci sono dati di fee/funding
+        """
+        if df.empty:
+            return df
+
+        try:
+            start_time = df['createdTime'].min()
+            end_time = df['updatedTime'].max()
+            with self.pool.reader() as conn:
+                executions = self._read_range(conn, 'executions', 'execTime', start_time, end_time)
+                funding = self._read_range(conn, 'funding', 'transactionTime', start_time, end_time)
+            if executions.empty and funding.empty:
+                return df
+            return attach_fees_and_funding(df, executions, funding)
+        except Exception as e:
+            logger.error(f"Error attaching fees and funding for account {self.account}: {str(e)}")
+            raise
+
     def close(self):
-        """Chiude la connessione al database"""
-        if self.conn:
-            self.conn.close()
-            logger.info(f"Closed database connection for account {self.account}")
-
-    def __del__(self):
-        """Assicura che la connessione venga chiusa quando l'oggetto viene distrutto"""
-        self.close()
\ No newline at end of file
+        """
+        Rilascia il database manager. Le connessioni restano aperte nel pool condiviso
+        e vengono chiuse all'uscita del processo (connection_pool.close_connection_pools)
+        """
+        self.pool = None
+
+
+def create_db_manager(account="main"):
+    """
+    Restituisce il database manager per l'account in base a config.QUERY_BACKEND
+
+    :param account: Nome dell'account (default: "main")
+    """
+    if config.QUERY_BACKEND == 'duckdb':
+        from .duckdb_backend import DuckDBManager
+        return DuckDBManager(account)
+    return DBManager(account)
+
+
+def write_chunks(chunks, path, fmt='csv'):
+    """
+    Scrive una sequenza di DataFrame in un unico file CSV o Parquet, un blocco alla volta
+
+    :param chunks: Iterabile di DataFrame con le stesse colonne
+    :param path: Percorso del file di destinazione
+    :param fmt: Formato del file ('csv' o 'parquet')
+    :return: Numero di righe scritte
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    rows = 0
+    columns = None
+
+    def aligned(chunks):
+        # Le colonne del primo blocco valgono per tutto il file (gli account possono avere schemi diversi)
+        nonlocal columns
+        for chunk in chunks:
+            if columns is None:
+                columns = list(chunk.columns)
+            yield chunk.reindex(columns=columns)
+
+    if fmt == 'csv':
+        with open(path, 'w', newline='') as f:
+            for chunk in aligned(chunks):
+                chunk.to_csv(f, header=(rows == 0), index=False)
+                rows += len(chunk)
+        return rows
+
+    if fmt != 'parquet':
+        raise ValueError(f"Formato di esportazione non supportato: {fmt}")
+
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("L'esportazione Parquet richiede il pacchetto 'pyarrow' (pip install pyarrow)")
+
+    writer = None
+    try:
+        for chunk in aligned(chunks):
+            if writer is None:
+                writer = pq.ParquetWriter(path, _parquet_schema(chunk, pa))
+            writer.write_table(pa.Table.from_pandas(chunk, schema=writer.schema, preserve_index=False))
+            rows += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+def _parquet_schema(chunk, pa):
+    """
+    Schema Parquet del file esportato. Non dipende dai valori del primo blocco: una colonna
+    tutta vuota verrebbe dedotta come tipo null e una colonna REAL con soli valori interi come
+    int64, e i blocchi successivi non sarebbero più convertibili.
+    - colonne della tabella trades: tipo dichiarato in TRADES_COLUMNS
+    - altre colonne: tipo dedotto dal primo blocco, con i numeri interi letti come float
+      (SQLite non garantisce il tipo) e le colonne vuote come stringhe
+
+    :param chunk: Primo blocco esportato
+    :param pa: Modulo pyarrow
+    """
+    declared = {
+        'TEXT': pa.string(),
+        'REAL': pa.float64(),
+        'INTEGER': pa.int64(),
+        'TIMESTAMP': pa.timestamp('ns'),
+    }
+    inferred = pa.Schema.from_pandas(chunk, preserve_index=False)
+    fields = []
+    for field in inferred:
+        if field.name in TRADES_COLUMNS:
+            field = field.with_type(declared[TRADES_COLUMNS[field.name]])
+        elif pa.types.is_null(field.type):
+            field = field.with_type(pa.string())
+        elif pa.types.is_integer(field.type):
+            field = field.with_type(pa.float64())
+        fields.append(field)
+    return pa.schema(fields)
+
+
+def export_accounts_trades(accounts, path, fmt='csv', start_time=None, end_time=None, **filters):
+    """
+    Esporta in un unico file i trades filtrati di più account, aggiungendo la colonna account.
+    Gli account senza database locale vengono saltati.
+
+    :return: Numero di righe esportate
+    """
+    def chunks():
+        for account in accounts:
+            if not DBManager.database_path(account).exists():
+                logger.warning(f"No local database for account {account}, skipping export")
+                continue
+            db = DBManager(account)
+            try:
+                for chunk in db.iter_trades(start_time, end_time, **filters):
+                    chunk.insert(0, 'account', account)
+                    yield chunk
+            finally:
+                db.close()
+
+    rows = write_chunks(chunks(), path, fmt)
+    logger.info(f"Exported {rows} trades for {len(accounts)} accounts to {path}")
+    return rows
\ No newline at end of file
@@ -0,0 +1,308 @@
+from pathlib import Path
+from . import config
+from .db_manager import DBManager, EXPORT_CHUNK_SIZE
+from .logger import logger
+
+try:
+    import duckdb
+except ImportError:  # Dipendenza opzionale, richiesta solo con PNL_QUERY_BACKEND=duckdb
+    duckdb = None
+
+
+# Bucket temporali con le stesse etichette usate da pandas resample ('D', 'W', 'M')
+BUCKET_EXPRESSIONS = {
+    '1d': "date_trunc('day', updatedTime)",
+    '1w': "date_trunc('week', updatedTime) + INTERVAL 6 DAY",
+    '1M': "CAST(last_day(updatedTime) AS TIMESTAMP)",
+}
+RESAMPLE_MAP = {'1d': 'D', '1w': 'W', '1M': 'M'}
+
+
+class DuckDBManager:
+    """
+    Backend analitico compatibile con DBManager che esegue filtri, aggregazioni e statistiche
+    dentro DuckDB, leggendo direttamente i file SQLite degli account (o un file Parquet
+    data/<account>_trades.parquet, se più recente del database).
+
+    Le scritture restano delegate a DBManager, quindi i file SQLite rimangono la fonte dei dati.
+    """
+
+    def __init__(self, account="main", accounts=None):
+        """
+        Inizializza il backend per uno o più account
+
+        :param account: Nome dell'account (default: "main")
+        :param accounts: Lista di account da interrogare insieme; se indicata sostituisce account
+        """
+        if duckdb is None:
+            raise ImportError("Il backend DuckDB richiede il pacchetto 'duckdb' (pip install duckdb)")
+
+        self.accounts = [a.lower().replace(" ", "_") for a in (accounts or [account])]
+        self.account = self.accounts[0]
+        self.data_dir = Path("data")
+        self.writer = DBManager(account) if not accounts else None
+        self.conn = None
+        self.connect()
+
+    @classmethod
+    def for_accounts(cls, accounts):
+        """Crea un backend in sola lettura su tutti gli account indicati"""
+        return cls(accounts=accounts)
+
+    def _source_path(self, account):
+        """
+        Sceglie il file da cui leggere i trades dell'account. Il database SQLite è quello aggiornato
+        da sincronizzazioni e live stream: un file Parquet viene usato solo se più recente
+        """
+        sqlite_path = self.data_dir / f"{account}_trades.sqlite"
+        parquet_path = self.data_dir / f"{account}_trades.parquet"
+        if not sqlite_path.exists():
+            return parquet_path if parquet_path.exists() else None
+        if parquet_path.exists():
+            # Con il journal WAL le ultime scritture possono trovarsi ancora nel file -wal
+            wal_path = sqlite_path.with_name(sqlite_path.name + "-wal")
+            sqlite_mtime = max(p.stat().st_mtime for p in (sqlite_path, wal_path) if p.exists())
+            if parquet_path.stat().st_mtime > sqlite_mtime:
+                return parquet_path
+            logger.warning(f"Ignoring {parquet_path}: older than {sqlite_path}")
+        return sqlite_path
+
+    def _load_sqlite_extension(self):
+        """Carica l'estensione sqlite di DuckDB, che va installata una volta sola (vedi README)"""
+        try:
+            self.conn.execute("LOAD sqlite")
+        except Exception as e:
+            raise RuntimeError(
+                "L'estensione sqlite di DuckDB non è installata. Installala una volta con: "
+                "python -c \"import duckdb; duckdb.install_extension('sqlite')\""
+            ) from e
+
+    def connect(self):
+        """Apre una connessione DuckDB in memoria e collega i file di ogni account"""
+        try:
+            self.conn = duckdb.connect()
+            sources = []
+            sqlite_loaded = False
+            for i, account in enumerate(self.accounts):
+                path = self._source_path(account)
+                if path is None:
+                    logger.warning(f"No local data for account {account}, skipping")
+                    continue
+                if path.suffix == ".parquet":
+                    source = f"read_parquet('{path.as_posix()}')"
+                else:
+                    if not sqlite_loaded:
+                        self._load_sqlite_extension()
+                        sqlite_loaded = True
+                    self.conn.execute(f"ATTACH '{path.as_posix()}' AS acc_{i} (TYPE sqlite, READ_ONLY)")
+                    source = f"acc_{i}.trades"
+                sources.append(f"SELECT '{account}' AS account, * FROM {source}")
+
+            if not sources:
+                raise FileNotFoundError(f"No trades database found for accounts {self.accounts}")
+
+            # Un'unica vista su tutti gli account: le query cross-account diventano una sola SELECT
+            self.conn.execute(f"""
+                CREATE OR REPLACE VIEW raw_trades AS {' UNION ALL BY NAME '.join(sources)}
+            """)
+            columns = {row[0] for row in self.conn.execute("DESCRIBE raw_trades").fetchall()}
+            # I trades salvati prima del supporto multi-categoria possono non avere la categoria: sono linear
+            default_category = f"'{config.DEFAULT_CATEGORY}'"
+            if "category" in columns:
+                replace_category, add_category = f", COALESCE(category, {default_category}) AS category", ""
+            else:
+                replace_category, add_category = "", f", {default_category} AS category"
+            self.conn.execute(f"""
+                CREATE OR REPLACE VIEW trades AS
+                SELECT * REPLACE (
+                    TRY_CAST(createdTime AS TIMESTAMP) AS createdTime,
+                    TRY_CAST(updatedTime AS TIMESTAMP) AS updatedTime{replace_category}
+                ){add_category}
+                FROM raw_trades
+            """)
+            logger.info(f"Connected DuckDB backend for accounts {self.accounts}")
+        except Exception as e:
+            logger.error(f"Error connecting DuckDB backend for accounts {self.accounts}: {str(e)}")
+            raise
+
+    def _where(self, start_time=None, end_time=None, symbol=None, side=None, category=None):
+        """Costruisce la clausola WHERE e i parametri per i filtri comuni"""
+        conditions = []
+        params = []
+
+        if start_time:
+            conditions.append("updatedTime >= ?")
+            params.append(start_time)
+        if end_time:
+            conditions.append("updatedTime <= ?")
+            params.append(end_time)
+        if symbol:
+            conditions.append("symbol = ?")
+            params.append(symbol)
+        if side:
+            conditions.append("side = ?")
+            params.append(side)
+        if category:
+            conditions.append("category = ?")
+            params.append(category)
+
+        where = " WHERE " + " AND ".join(conditions) if conditions else ""
+        return where, params
+
+    def save_trades(self, df):
+        """Salva i trades nel database SQLite dell'account tramite DBManager"""
+        if self.writer is None:
+            raise RuntimeError("Il backend multi-account è in sola lettura")
+        self.writer.save_trades(df)
+
+    def upsert_trades(self, df, key='orderId'):
+        """Inserisce o aggiorna i trades nel database SQLite dell'account tramite DBManager"""
+        if self.writer is None:
+            raise RuntimeError("Il backend multi-account è in sola lettura")
+        self.writer.upsert_trades(df, key)
+
+    def save_executions(self, df):
+        """Salva le esecuzioni nel database SQLite dell'account tramite DBManager"""
+        if self.writer is None:
+            raise RuntimeError("Il backend multi-account è in sola lettura")
+        self.writer.save_executions(df)
+
+    def save_funding(self, df):
+        """Salva i movimenti di funding nel database SQLite dell'account tramite DBManager"""
+        if self.writer is None:
+            raise RuntimeError("Il backend multi-account è in sola lettura")
+        self.writer.save_funding(df)
+
+    def add_fees_and_funding(self, df):
+        """Aggiunge fee e funding ai trades usando le tabelle di arricchimento dell'account"""
+        if self.writer is None:
+            return df
+        return self.writer.add_fees_and_funding(df)
+
+    def get_trades(self, start_time=None, end_time=None, symbol=None, side=None, category=None):
+        """Recupera i trades con i filtri applicati direttamente in DuckDB"""
+        where, params = self._where(start_time, end_time, symbol, side, category)
+        try:
+            return self.conn.execute(f"SELECT * FROM trades{where}", params).df()
+        except Exception as e:
+            logger.error(f"Error retrieving trades for accounts {self.accounts}: {str(e)}")
+            raise
+
+    def iter_trades(self, start_time=None, end_time=None, chunksize=EXPORT_CHUNK_SIZE, **filters):
+        """Restituisce i trades filtrati a blocchi di chunksize righe, senza caricarli tutti in memoria"""
+        where, params = self._where(start_time, end_time, **filters)
+        reader = self.conn.execute(f"SELECT * FROM trades{where}", params).fetch_record_batch(chunksize)
+        for batch in reader:
+            yield batch.to_pandas()
+
+    def export_trades(self, path, fmt='csv', start_time=None, end_time=None, **filters):
+        """
+        Esporta i trades filtrati in CSV o Parquet con COPY, che DuckDB scrive in streaming
+
+        :return: Numero di righe esportate
+        """
+        if fmt not in ('csv', 'parquet'):
+            raise ValueError(f"Formato di esportazione non supportato: {fmt}")
+
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        where, params = self._where(start_time, end_time, **filters)
+        options = "FORMAT csv, HEADER" if fmt == 'csv' else "FORMAT parquet"
+        try:
+            self.conn.execute(f"COPY (SELECT * FROM trades{where}) TO '{path.as_posix()}' ({options})", params)
+            rows = self.conn.execute(f"SELECT COUNT(*) FROM trades{where}", params).fetchone()[0]
+        except Exception as e:
+            logger.error(f"Error exporting trades for accounts {self.accounts}: {str(e)}")
+            raise
+        logger.info(f"Exported {rows} trades for accounts {self.accounts} to {path}")
+        return rows
+
+    def _check_single_category(self, where, params):
+        """
+        Come BybitClient.aggregate_pnl: rifiuta le somme di PNL su più categorie,
+        perché linear (USDT) e inverse (moneta base) hanno unità diverse
+        """
+        categories = [row[0] for row in self.conn.execute(f"SELECT DISTINCT category FROM trades{where}", params).fetchall()]
+        if len(categories) > 1:
+            raise ValueError(f"Cannot aggregate PNL across categories {sorted(categories)}: filter by category first")
+
+    def get_metrics(self, start_time=None, end_time=None, **filters):
+        """
+        Calcola le statistiche generali della dashboard in una sola query
+
+        :return: Dizionario con total_pnl, total_trades, win_rate, avg_pnl
+        """
+        where, params = self._where(start_time, end_time, **filters)
+        if not filters.get('category'):
+            self._check_single_category(where, params)
+        total_pnl, total_trades, win_rate, avg_pnl = self.conn.execute(f"""
+            SELECT
+                COALESCE(SUM(closedPnl), 0),
+                COUNT(*),
+                AVG(CASE WHEN closedPnl > 0 THEN 100.0 ELSE 0.0 END),
+                AVG(closedPnl)
+            FROM trades{where}
+        """, params).fetchone()
+        return {
+            'total_pnl': total_pnl,
+            'total_trades': total_trades,
+            'win_rate': win_rate,
+            'avg_pnl': avg_pnl,
+        }
+
+    def aggregate_pnl(self, timeframe='1d', start_time=None, end_time=None, by_account=False, **filters):
+        """
+        Equivalente SQL di BybitClient.aggregate_pnl: restituisce solo le righe aggregate
+
+        :param timeframe: Timeframe di aggregazione ('1d', '1w', '1M')
+        :param by_account: Se True aggiunge la colonna account e aggrega separatamente per account
+        """
+        bucket = BUCKET_EXPRESSIONS.get(timeframe, BUCKET_EXPRESSIONS['1d'])
+        where, params = self._where(start_time, end_time, **filters)
+        if not filters.get('category'):
+            self._check_single_category(where, params)
+        group_by = "account, 1" if by_account else "1"
+
+        try:
+            aggregated = self.conn.execute(f"""
+                SELECT
+                    {bucket} AS updatedTime,
+                    {'account,' if by_account else ''}
+                    SUM(closedPnl) AS closedPnl,
+                    SUM(fillCount) AS fillCount,
+                    COUNT(symbol) AS trades,
+                    SUM((epoch_ms(updatedTime) - epoch_ms(createdTime)) / 60000.0) AS duration_total,
+                    AVG((epoch_ms(updatedTime) - epoch_ms(createdTime)) / 60000.0) AS duration_avg,
+                    AVG(CASE WHEN closedPnl > 0 THEN 100.0 ELSE 0.0 END) AS winRate,
+                    ROUND(CASE WHEN SUM(invested_capital) = 0 THEN 0
+                               ELSE SUM(closedPnl) / SUM(invested_capital) * 100 END, 2) AS pct
+                FROM trades{where}
+                GROUP BY {group_by}
+                ORDER BY 1
+            """, params).df()
+        except Exception as e:
+            logger.error(f"Error aggregating trades for accounts {self.accounts}: {str(e)}")
+            raise
+
+        if aggregated.empty or by_account:
+            return aggregated
+
+        # Come pandas resample, include anche i periodi senza trades
+        aggregated = aggregated.set_index('updatedTime').asfreq(RESAMPLE_MAP.get(timeframe, 'D'))
+        fill_zero = ['closedPnl', 'fillCount', 'trades', 'duration_total', 'pct']
+        aggregated[fill_zero] = aggregated[fill_zero].fillna(0)
+        aggregated['trades'] = aggregated['trades'].astype(int)
+        return aggregated.reset_index()
+
+    def close(self):
+        """Chiude la connessione DuckDB"""
+        if self.conn:
+            self.conn.close()
+            self.conn = None
+            logger.info(f"Closed DuckDB backend for accounts {self.accounts}")
+        if self.writer is not None:
+            self.writer.close()
+
+    def __del__(self):
+        """Assicura che la connessione venga chiusa quando l'oggetto viene distrutto"""
+        self.close()
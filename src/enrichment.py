@@ -0,0 +1,67 @@
+import pandas as pd
+from . import config
+
+
+def _attach_asof(trades, events, time_column, value_column):
+    """
+    Somma i valori degli eventi (fee o funding) sul primo trade dello stesso symbol e categoria
+    che si chiude dopo l'evento, con un merge_asof sui tempi ordinati invece di lookup per riga.
+
+    :return: Serie indicizzata come trades con la somma dei valori attribuiti
+    """
+    if events.empty:
+        return pd.Series(0.0, index=trades.index)
+
+    # merge_asof richiede chiavi con la stessa risoluzione: DuckDB restituisce datetime64[us],
+    # pandas e SQLite datetime64[ns]
+    closes = (trades[['updatedTime', 'symbol', 'category']]
+              .assign(trade_row=trades.index,
+                      updatedTime=trades['updatedTime'].astype('datetime64[ns]'))
+              .sort_values('updatedTime'))
+    events = (events[[time_column, 'symbol', 'category', value_column]]
+              .astype({time_column: 'datetime64[ns]'})
+              .sort_values(time_column))
+
+    matched = pd.merge_asof(
+        events,
+        closes,
+        left_on=time_column,
+        right_on='updatedTime',
+        by=['symbol', 'category'],
+        direction='forward'
+    )
+    # Gli eventi successivi all'ultima chiusura appartengono a posizioni ancora aperte
+    matched = matched.dropna(subset=['trade_row'])
+    totals = matched.groupby('trade_row')[value_column].sum()
+    return totals.reindex(trades.index, fill_value=0.0)
+
+
+def attach_fees_and_funding(trades, executions, funding):
+    """
+    Attribuisce fee di trading e funding a ciascun trade chiuso.
+
+    Ogni esecuzione e ogni pagamento di funding viene assegnato alla prima chiusura successiva
+    dello stesso symbol: le fee di apertura e il funding maturato durante la posizione
+    finiscono quindi sul trade che la chiude.
+
+    Il closedPnl di Bybit è il PnL della posizione al netto delle fee di apertura e chiusura
+    e del funding (definizione di Closed P&L della documentazione Bybit):
+    - gross_pnl: PnL della posizione prima di fee e funding (closedPnl + fees - funding)
+    - net_pnl: PnL dopo fee e funding, cioè closedPnl
+
+    :param trades: DataFrame dei trades (closedPnl già al netto di fee di trading e funding)
+    :param executions: DataFrame con execTime, symbol, category, execFee (fee positive = costo)
+    :param funding: DataFrame con transactionTime, symbol, category, funding (positivo = incassato)
+    :return: Copia di trades con le colonne fees, funding, gross_pnl e net_pnl
+    """
+    trades = trades.copy()
+    if 'category' not in trades.columns:
+        trades['category'] = config.DEFAULT_CATEGORY
+
+    trades['fees'] = _attach_asof(trades, executions, 'execTime', 'execFee')
+    trades['funding'] = _attach_asof(trades, funding, 'transactionTime', 'funding')
+
+    # closedPnl include già fee e funding: il lordo riaggiunge le fee e toglie il funding incassato
+    trades['gross_pnl'] = trades['closedPnl'] + trades['fees'] - trades['funding']
+    trades['net_pnl'] = trades['closedPnl']
+    return trades
@@ -0,0 +1,309 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import threading
+import time
+
+import websockets
+
+from . import config
+from .bybit_client import BybitClient
+from .db_manager import DBManager
+from .logger import logger
+
+
+class LivePnlStream:
+    """
+    Ingestione quasi in tempo reale dei PnL chiusi tramite i topic privati WebSocket di Bybit.
+
+    Ascolta i topic 'position' ed 'execution': le esecuzioni che riducono una posizione vengono
+    raggruppate per ordine e, quando l'ordine è completamente eseguito, convertite in un record
+    con lo stesso formato dell'endpoint closed-pnl e salvate con DBManager.upsert_trades.
+    Al successivo "Refresh Week" i record vengono sostituiti da quelli ufficiali (stesso orderId).
+
+    Le posizioni già aperte prima della connessione vengono lette da REST (/v5/position/list)
+    a ogni connessione, così che anche la loro chiusura produca un record.
+
+    Lo stream può essere condiviso da più utilizzatori (es. sessioni Streamlit) con subscribe/unsubscribe:
+    parte con il primo utilizzatore e si ferma quando l'ultimo lo rilascia o non è più attivo.
+    """
+
+    PING_INTERVAL = 20  # Secondi tra un ping e l'altro, come richiesto da Bybit
+    RECONNECT_DELAY = 5  # Secondi di attesa prima di riconnettersi
+
+    def __init__(self, account_name='Main', url=None, on_trades=None, is_subscriber_active=None):
+        """
+        Inizializza lo stream per l'account specificato
+
+        :param account_name: Nome dell'account da utilizzare (default: 'Main')
+        :param url: Endpoint WebSocket privato (default: config.BYBIT_WS_PRIVATE_URL)
+        :param on_trades: Callback chiamata con la lista dei nuovi record chiusi;
+                          di default i record vengono salvati nel database dell'account
+        :param is_subscriber_active: Funzione che indica se un utilizzatore è ancora attivo
+                                     (es. sessione Streamlit aperta); quelli non più attivi
+                                     vengono rimossi periodicamente
+        """
+        if account_name not in config.BYBIT_SUBACCOUNTS:
+            raise ValueError(f"Account '{account_name}' non trovato nella configurazione")
+
+        account = config.BYBIT_SUBACCOUNTS[account_name]
+        self.account_name = account_name
+        self.api_key = account['api_key']
+        self.api_secret = account['api_secret']
+        self.url = url or config.BYBIT_WS_PRIVATE_URL
+        self.on_trades = on_trades or self._save_trades
+        self.is_subscriber_active = is_subscriber_active
+
+        # Ultima posizione aperta nota per (categoria, simbolo) ed esecuzioni in attesa per ordine
+        self.positions = {}
+        self.pending_orders = {}
+
+        self.last_update = None
+        self.trades_received = 0
+        self._db = None
+        self._client = BybitClient(account_name)
+        self._thread = None
+        self._stop = threading.Event()
+        self._subscribers = set()
+        self._subscribers_lock = threading.Lock()
+
+    def _auth_message(self):
+        """Costruisce il messaggio di autenticazione per i topic privati"""
+        expires = int((time.time() + 10) * 1000)
+        signature = hmac.new(
+            self.api_secret.encode("utf-8"),
+            f"GET/realtime{expires}".encode("utf-8"),
+            hashlib.sha256
+        ).hexdigest()
+        return {"op": "auth", "args": [self.api_key, expires, signature]}
+
+    def handle_message(self, message):
+        """
+        Elabora un messaggio del WebSocket e restituisce i record closed PnL completati
+
+        :param message: Messaggio già decodificato dal JSON
+        """
+        topic = message.get("topic")
+        if topic == "position":
+            for position in message.get("data", []):
+                self._update_position(position)
+            return []
+        if topic == "execution":
+            closed = []
+            for execution in message.get("data", []):
+                record = self._add_execution(execution)
+                if record:
+                    closed.append(record)
+            return closed
+        return []
+
+    def _update_position(self, position):
+        """Memorizza prezzo medio e apertura della posizione, necessari per calcolare il PnL alla chiusura"""
+        key = (position.get("category", config.DEFAULT_CATEGORY), position["symbol"])
+        # Quando la posizione si chiude Bybit invia size 0 e avgPrice 0: si mantiene l'ultimo valore valido
+        if float(position.get("size") or 0) > 0:
+            self.positions[key] = {
+                "avgPrice": float(position["avgPrice"]),
+                "createdTime": position.get("createdTime"),
+            }
+
+    def load_open_positions(self):
+        """Memorizza le posizioni già aperte, lette da REST, per poter calcolare il PnL della loro chiusura"""
+        for position in self._client.get_open_positions():
+            self._update_position(position)
+
+    def _add_execution(self, execution):
+        """Accumula un'esecuzione di chiusura e restituisce il record quando l'ordine è completo"""
+        if execution.get("execType") != "Trade" or float(execution.get("closedSize") or 0) <= 0:
+            return None
+
+        order_id = execution["orderId"]
+        order = self.pending_orders.setdefault(order_id, {
+            "symbol": execution["symbol"],
+            "category": execution.get("category", config.DEFAULT_CATEGORY),
+            "side": execution["side"],
+            "orderType": execution.get("orderType"),
+            "closedSize": 0.0,
+            "exitValue": 0.0,
+            "fees": 0.0,
+            "fillCount": 0,
+            "firstExecTime": execution["execTime"],
+        })
+        qty = float(execution["closedSize"])
+        order["closedSize"] += qty
+        order["exitValue"] += qty * float(execution["execPrice"])
+        order["fees"] += float(execution.get("execFee") or 0)
+        order["fillCount"] += 1
+        order["lastExecTime"] = execution["execTime"]
+
+        if float(execution.get("leavesQty") or 0) > 0:
+            return None
+        return self._build_record(order_id, self.pending_orders.pop(order_id))
+
+    def _build_record(self, order_id, order):
+        """Converte le esecuzioni aggregate di un ordine in un record nel formato closed-pnl"""
+        position = self.positions.get((order["category"], order["symbol"]))
+        if position is None:
+            logger.warning(f"No open position known for {order['symbol']}, skipping live record for order {order_id}")
+            return None
+
+        entry_price = position["avgPrice"]
+        exit_price = order["exitValue"] / order["closedSize"]
+        size = order["closedSize"]
+        # Un ordine Sell chiude una posizione long, un ordine Buy una posizione short
+        direction = 1 if order["side"] == "Sell" else -1
+        if order["category"] == "inverse":
+            gross_pnl = direction * size * (1 / entry_price - 1 / exit_price)
+        else:
+            gross_pnl = direction * size * (exit_price - entry_price)
+
+        return {
+            "symbol": order["symbol"],
+            "category": order["category"],
+            "orderId": order_id,
+            "side": order["side"],
+            "qty": str(size),
+            "orderType": order["orderType"],
+            "execType": "Trade",
+            "closedSize": str(size),
+            "cumEntryValue": str(size * entry_price),
+            "avgEntryPrice": str(entry_price),
+            "cumExitValue": str(order["exitValue"]),
+            "avgExitPrice": str(exit_price),
+            "closedPnl": str(gross_pnl - order["fees"]),
+            "fillCount": str(order["fillCount"]),
+            "createdTime": position.get("createdTime") or order["firstExecTime"],
+            "updatedTime": order["lastExecTime"],
+        }
+
+    def _save_trades(self, records):
+        """Callback di default: normalizza i record e li salva nel database dell'account"""
+        # Le scritture usano la connessione di scrittura condivisa del processo, sotto lock
+        if self._db is None:
+            self._db = DBManager(self.account_name)
+        self._db.upsert_trades(self._client._build_dataframe(records))
+
+    async def run(self):
+        """Mantiene la connessione al WebSocket, riconnettendosi in caso di errore"""
+        while not self._stop.is_set():
+            try:
+                await self._listen()
+            except Exception as e:
+                logger.error(f"Live stream error for account {self.account_name}: {str(e)}")
+            # Attesa interrotta subito da stop(), senza bloccare l'event loop
+            await asyncio.to_thread(self._stop.wait, self.RECONNECT_DELAY)
+
+    async def _listen(self):
+        """Autentica, sottoscrive i topic ed elabora i messaggi fino alla disconnessione"""
+        async with websockets.connect(self.url) as ws:
+            await ws.send(json.dumps(self._auth_message()))
+            await ws.send(json.dumps({"op": "subscribe", "args": ["position", "execution"]}))
+            logger.info(f"Live stream connected for account {self.account_name}")
+
+            # Letto dopo la sottoscrizione: gli aggiornamenti arrivati nel frattempo vengono
+            # elaborati dopo e sostituiscono lo stato letto da REST
+            try:
+                await asyncio.to_thread(self.load_open_positions)
+            except Exception as e:
+                logger.warning(f"Could not load open positions for account {self.account_name}: {str(e)}")
+
+            last_ping = time.monotonic()
+            while not self._stop.is_set():
+                if time.monotonic() - last_ping >= self.PING_INTERVAL:
+                    await ws.send(json.dumps({"op": "ping"}))
+                    last_ping = time.monotonic()
+                    self.release_inactive()
+                try:
+                    raw = await asyncio.wait_for(ws.recv(), timeout=1)
+                except asyncio.TimeoutError:
+                    continue
+
+                message = json.loads(raw)
+                if message.get("op") == "auth" and not message.get("success"):
+                    raise RuntimeError(f"Authentication failed: {message.get('ret_msg')}")
+
+                records = self.handle_message(message)
+                if records:
+                    self.on_trades(records)
+                    self.trades_received += len(records)
+                    self.last_update = time.time()
+                    logger.info(f"Live stream stored {len(records)} closed trades for account {self.account_name}")
+
+    def start(self):
+        """Avvia lo stream in un thread in background"""
+        if self._thread is not None and self._stop.is_set():
+            # Uno stream in chiusura viene atteso prima di avviarne uno nuovo
+            self._thread.join(timeout=5)
+        self._start_thread()
+
+    def _start_thread(self):
+        """Crea il thread dello stream se non è già in esecuzione"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=lambda: asyncio.run(self.run()), daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Ferma lo stream e attende la chiusura del thread"""
+        self._stop.set()
+        self._join()
+
+    def _join(self):
+        """Attende la chiusura del thread dello stream (tranne se chiamato dal thread stesso)"""
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=5)
+
+    def subscribe(self, subscriber):
+        """
+        Registra un utilizzatore dello stream e lo avvia se non è già attivo
+
+        :param subscriber: Identificativo dell'utilizzatore (es. id della sessione Streamlit)
+        """
+        # Le attese sul thread avvengono fuori dal lock, che serve anche al thread (release_inactive)
+        with self._subscribers_lock:
+            self._subscribers.add(subscriber)
+            stopping = self._stop.is_set()
+        if stopping:
+            self._join()
+        with self._subscribers_lock:
+            if subscriber in self._subscribers:
+                self._start_thread()
+
+    def unsubscribe(self, subscriber):
+        """Rimuove un utilizzatore e ferma lo stream se non ne restano altri"""
+        with self._subscribers_lock:
+            self._subscribers.discard(subscriber)
+            if self._subscribers:
+                return
+            self._stop.set()
+        self._join()
+
+    def release_inactive(self):
+        """Rimuove gli utilizzatori non più attivi; se non ne resta nessuno lo stream si ferma"""
+        if self.is_subscriber_active is None:
+            return
+        with self._subscribers_lock:
+            inactive = {s for s in self._subscribers if not self.is_subscriber_active(s)}
+            if not inactive:
+                return
+            self._subscribers -= inactive
+            logger.info(f"Released {len(inactive)} inactive live stream subscribers for account {self.account_name}")
+            if not self._subscribers:
+                # Chiamato anche dal thread dello stream: basta segnalare l'arresto
+                self._stop.set()
+
+    def is_running(self):
+        """Indica se il thread dello stream è attivo"""
+        return self._thread is not None and self._thread.is_alive()
+
+
+if __name__ == "__main__":
+    import sys
+
+    stream = LivePnlStream(sys.argv[1] if len(sys.argv) > 1 else 'Main')
+    try:
+        asyncio.run(stream.run())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,40 @@
+import asyncio
+import threading
+import time
+
+
+class RateLimiter:
+    """
+    Limita il numero di richieste al secondo distribuendole a intervalli regolari.
+
+    Lo stesso limiter può essere condiviso tra thread (acquire) e coroutine (acquire_async),
+    in modo che più categorie scaricate in parallelo restino dentro un unico budget.
+    """
+
+    def __init__(self, rate):
+        """
+        :param rate: Numero massimo di richieste al secondo
+        """
+        self.interval = 1.0 / rate
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def _reserve(self):
+        """Prenota il prossimo slot libero e restituisce i secondi di attesa"""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+            return slot - now
+
+    def acquire(self):
+        """Attende (bloccando il thread) il proprio turno"""
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        """Attende il proprio turno senza bloccare l'event loop"""
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
@@ -1,3 +1,5 @@
+from datetime import datetime, timedelta
+
 def style_pnl_column(val):
     """Helper function to style PNL values and percentages with colors"""
     if val > 0:
@@ -14,4 +16,21 @@ def style_side_column(val):
         color = 'rgb(0, 255, 0)'  # Verde brillante
     else:  # Sell
         color = 'rgb(255, 0, 0)'  # Rosso
-    return f'color: {color}'
\ No newline at end of file
+    return f'color: {color}'
+
+def get_period_start(period, end_time):
+    """Restituisce l'inizio del periodo selezionato (None per 'All')"""
+    if period == "7D":
+        return end_time - timedelta(days=7)
+    elif period == "1M":
+        return end_time - timedelta(days=30)
+    elif period == "3M":
+        return end_time - timedelta(days=90)
+    elif period == "6M":
+        return end_time - timedelta(days=180)
+    elif period == "1Y":
+        return end_time - timedelta(days=365)
+    elif period == "YTD":
+        return datetime(end_time.year, 1, 1)
+    else:  # All
+        return None
\ No newline at end of file
@@ -0,0 +1,16 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# I test importano il pacchetto src dalla radice del repository, come app.py e report.py
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.connection_pool import close_connection_pools
+
+
+@pytest.fixture(autouse=True)
+def connection_pools():
+    """Ogni test usa database propri: i pool aperti vengono chiusi alla fine del test"""
+    yield
+    close_connection_pools()
@@ -0,0 +1,179 @@
+"""
+Confronta BybitClient (pybit) e AsyncBybitClient (aiohttp) contro un server Bybit finto locale:
+entrambi devono firmare le richieste correttamente, seguire la paginazione e produrre lo stesso DataFrame.
+"""
+import asyncio
+import hashlib
+import hmac
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pytest
+from aiohttp import web
+
+from src import config
+from src.async_bybit_client import AsyncBybitClient
+from src.bybit_client import BybitClient
+
+API_KEY = 'test-key'
+API_SECRET = 'test-secret'
+
+
+def make_records(category, count, now_ms, hours):
+    """Record closed-pnl sintetici, uno ogni `hours` ore a ritroso da now_ms"""
+    rng = random.Random(category)
+    records = []
+    for i in range(count):
+        updated = now_ms - i * hours * 3600 * 1000
+        records.append({
+            'symbol': 'BTCUSD' if category == 'inverse' else rng.choice(['BTCUSDT', 'ETHUSDT']),
+            'orderId': f'{category}-{i}',
+            'side': rng.choice(['Buy', 'Sell']),
+            'qty': '1',
+            'orderPrice': '100',
+            'orderType': 'Market',
+            'execType': 'Trade',
+            'closedSize': str(rng.randint(1, 5)),
+            'cumEntryValue': '100',
+            'avgEntryPrice': str(100 + i % 7),
+            'avgExitPrice': str(101 + i % 5),
+            'closedPnl': str(round(rng.uniform(-5, 5), 4)),
+            'fillCount': str(rng.randint(1, 3)),
+            'leverage': '10',
+            'createdTime': str(updated - 60000),
+            'updatedTime': str(updated),
+        })
+    return records
+
+
+class FakeBybit:
+    """Server aiohttp che risponde a /v5/position/closed-pnl verificando la firma, in un thread dedicato"""
+
+    def __init__(self, data):
+        self.data = data
+        self.paged_requests = 0
+        self.expired_requests = 0
+        self.loop = asyncio.new_event_loop()
+        self.runner = None
+        self.url = None
+
+    async def closed_pnl(self, request):
+        query = request.query_string
+        payload = f"{request.headers['X-BAPI-TIMESTAMP']}{API_KEY}{request.headers['X-BAPI-RECV-WINDOW']}{query}"
+        expected = hmac.new(API_SECRET.encode(), payload.encode(), hashlib.sha256).hexdigest()
+        if request.headers.get('X-BAPI-API-KEY') != API_KEY or request.headers.get('X-BAPI-SIGN') != expected:
+            return web.json_response({'retCode': 10004, 'retMsg': 'error sign!'})
+        # Come Bybit: la richiesta deve arrivare entro recv_window millisecondi dalla firma
+        if int(time.time() * 1000) - int(request.headers['X-BAPI-TIMESTAMP']) > int(request.headers['X-BAPI-RECV-WINDOW']):
+            self.expired_requests += 1
+            return web.json_response({'retCode': 10002, 'retMsg': 'invalid request, please check your server timestamp or recv_window param'})
+
+        params = request.query
+        rows = [r for r in self.data.get(params['category'], [])
+                if int(params['startTime']) <= int(r['updatedTime']) <= int(params['endTime'])]
+        if 'cursor' in params:
+            self.paged_requests += 1
+        offset = int(params.get('cursor', 0))
+        limit = int(params['limit'])
+        return web.json_response({
+            'retCode': 0,
+            'retMsg': 'OK',
+            'result': {
+                'list': rows[offset:offset + limit],
+                'nextPageCursor': str(offset + limit) if offset + limit < len(rows) else '',
+            },
+        })
+
+    async def _start(self):
+        app = web.Application()
+        app.router.add_get('/v5/position/closed-pnl', self.closed_pnl)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        host, port = self.runner.addresses[0][:2]
+        self.url = f'http://{host}:{port}'
+
+    def start(self):
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+        asyncio.run_coroutine_threadsafe(self._start(), self.loop).result(timeout=10)
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self.loop).result(timeout=10)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+@pytest.fixture
+def account(monkeypatch):
+    """Configura un solo account di test e ripristina le impostazioni alla fine"""
+    for name in [k for k in list(__import__('os').environ) if k.startswith('BYBIT_API_KEY')]:
+        monkeypatch.delenv(name)
+    monkeypatch.setenv('BYBIT_API_KEY_TEST', API_KEY)
+    monkeypatch.setenv('BYBIT_API_SECRET_TEST', API_SECRET)
+    monkeypatch.setenv('BYBIT_CATEGORIES', 'linear,inverse')
+    config.load_settings.cache_clear()
+    yield 'TEST'
+    config.load_settings.cache_clear()
+
+
+@pytest.fixture
+def fake_bybit():
+    now_ms = int(datetime.now().timestamp() * 1000)
+    # Un trade linear all'ora: più di una pagina da 100 record per intervallo di 7 giorni
+    server = FakeBybit({
+        'linear': make_records('linear', 400, now_ms, hours=1),
+        'inverse': make_records('inverse', 60, now_ms, hours=8),
+    })
+    server.start()
+    yield server
+    server.stop()
+
+
+def sorted_frame(df):
+    return df.sort_values('orderId').reset_index(drop=True)
+
+
+def test_async_and_sync_clients_return_the_same_dataframe(account, fake_bybit):
+    end_time = datetime.now()
+    start_time = end_time - timedelta(days=30)
+
+    client = BybitClient(account)
+    client.client.endpoint = fake_bybit.url
+    sync_df = client.get_pnl_dataframe(start_time, end_time)
+
+    async def fetch():
+        async with AsyncBybitClient(account, base_url=fake_bybit.url) as async_client:
+            return await async_client.get_pnl_dataframe(start_time, end_time)
+
+    async_df = asyncio.run(fetch())
+
+    assert len(sync_df) == 460
+    assert fake_bybit.paged_requests > 0
+    assert fake_bybit.expired_requests == 0
+    assert set(sync_df['category']) == {'linear', 'inverse'}
+    pd.testing.assert_frame_equal(sorted_frame(async_df), sorted_frame(sync_df))
+
+
+def test_async_client_signs_queued_requests_when_they_are_sent(account, fake_bybit, monkeypatch):
+    # Con il rate limit di 10 richieste al secondo le ultime richieste partono dopo più di un secondo
+    monkeypatch.setattr(config, 'RECV_WINDOW', 500)
+    end_time = datetime.now()
+    start_time = end_time - timedelta(days=30)
+
+    async def fetch():
+        async with AsyncBybitClient(account, base_url=fake_bybit.url) as async_client:
+            return await async_client.get_pnl_dataframe(start_time, end_time)
+
+    df = asyncio.run(fetch())
+
+    assert fake_bybit.expired_requests == 0
+    assert len(df) == 460
+
+
+def test_async_client_only_exposes_closed_pnl(account):
+    client = AsyncBybitClient(account)
+    assert not hasattr(client, 'get_all_executions')
+    assert not hasattr(client, 'get_funding_dataframe')
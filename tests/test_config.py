@@ -0,0 +1,14 @@
+import pytest
+
+from src import config
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('linear,inverse', ['linear', 'inverse']),
+    (' inverse , linear ', ['inverse', 'linear']),
+    ('lineer,inverse', ['inverse']),
+    ('spot', [config.DEFAULT_CATEGORY]),
+    ('', [config.DEFAULT_CATEGORY]),
+])
+def test_parse_categories_never_returns_an_empty_list(value, expected):
+    assert config.parse_categories(value) == expected
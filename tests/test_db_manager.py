@@ -0,0 +1,104 @@
+import sqlite3
+from functools import partialmethod
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src import config
+from src.connection_pool import close_connection_pools
+from src.db_manager import DBManager, export_accounts_trades, write_chunks
+
+
+def legacy_trades(count):
+    """Trades come salvati prima del supporto multi-categoria, senza colonna category"""
+    updated = pd.Timestamp('2024-01-01') + pd.to_timedelta(np.arange(count), unit='h')
+    return pd.DataFrame({
+        'symbol': 'BTCUSDT',
+        'orderId': [f'old-{i}' for i in range(count)],
+        'side': 'Buy',
+        'closedPnl': 1.0,
+        'createdTime': updated,
+        'updatedTime': updated,
+    })
+
+
+@pytest.fixture
+def legacy_store(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'data').mkdir()
+    conn = sqlite3.connect('data/legacy_trades.sqlite')
+    legacy_trades(100).to_sql('trades', conn, index=False)
+    conn.close()
+    return 'legacy'
+
+
+def test_upsert_on_legacy_store_keeps_history_in_default_category(legacy_store):
+    db = DBManager(legacy_store)
+    new = legacy_trades(2).assign(orderId=['new-0', 'new-1'], category='linear')
+    db.upsert_trades(new)
+
+    assert db.get_trades()['category'].value_counts(dropna=False).to_dict() == {config.DEFAULT_CATEGORY: 102}
+    assert len(db.get_trades(category=config.DEFAULT_CATEGORY)) == 102
+
+
+def test_missing_categories_are_filled_when_the_store_is_opened(legacy_store):
+    DBManager(legacy_store).upsert_trades(legacy_trades(2).assign(orderId=['new-0', 'new-1'], category='inverse'))
+    close_connection_pools()
+
+    # Database già scritto con righe senza categoria
+    conn = sqlite3.connect('data/legacy_trades.sqlite')
+    conn.execute("UPDATE trades SET category = NULL WHERE orderId LIKE 'old-%'")
+    conn.commit()
+    conn.close()
+
+    db = DBManager(legacy_store)
+    assert len(db.get_trades(category=config.DEFAULT_CATEGORY)) == 100
+    assert len(db.get_trades(category='inverse')) == 2
+
+
+def test_parquet_export_does_not_depend_on_the_first_chunk(tmp_path):
+    pytest.importorskip('pyarrow')
+    first = pd.DataFrame({
+        'symbol': ['BTCUSDT', 'ETHUSDT'],
+        'category': [None, None],
+        'closedSize': [1, 2],
+        'fillCount': [1, 2],
+        'orderLinkId': [None, None],
+        'leverage': [10, 20],
+        'updatedTime': pd.to_datetime(['2024-01-01', '2024-01-02']),
+    })
+    second = first.assign(
+        category=['linear', 'inverse'], closedSize=[0.5, np.nan], fillCount=[np.nan, 3.0],
+        orderLinkId=['a', None], leverage=[2.5, 5.0]
+    )
+
+    path = tmp_path / 'trades.parquet'
+    assert write_chunks([first, second], path, 'parquet') == 4
+
+    result = pd.read_parquet(path)
+    assert result['category'].tolist() == [None, None, 'linear', 'inverse']
+    assert result['closedSize'].tolist()[:3] == [1.0, 2.0, 0.5]
+    assert result['fillCount'].isna().tolist() == [False, False, True, False]
+    assert result['orderLinkId'].tolist() == [None, None, 'a', None]
+    assert result['leverage'].tolist() == [10.0, 20.0, 2.5, 5.0]
+
+
+def test_accounts_parquet_export_spans_several_chunks(legacy_store, monkeypatch):
+    pytest.importorskip('pyarrow')
+    monkeypatch.setattr(DBManager, 'iter_trades', partialmethod(DBManager.iter_trades, chunksize=30))
+    # Righe aggiunte dopo il supporto multi-categoria, con colonne assenti nei trades precedenti
+    DBManager(legacy_store).upsert_trades(
+        legacy_trades(2).assign(
+            orderId=['new-0', 'new-1'], category='inverse', closedSize=[0.5, 1.5],
+            createdTime=pd.to_datetime(['2024-06-01', '2024-06-02']),
+            updatedTime=pd.to_datetime(['2024-06-01', '2024-06-02'])
+        )
+    )
+
+    rows = export_accounts_trades([legacy_store], 'exports/trades.parquet', 'parquet')
+
+    result = pd.read_parquet('exports/trades.parquet')
+    assert rows == len(result) == 102
+    assert result['closedSize'].notna().sum() == 2
+    assert result['category'].value_counts().to_dict() == {config.DEFAULT_CATEGORY: 100, 'inverse': 2}
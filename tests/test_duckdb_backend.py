@@ -0,0 +1,167 @@
+"""
+Verifica il backend DuckDB sul percorso reale (database SQLite degli account) confrontandolo con pandas.
+Richiede duckdb con l'estensione sqlite installata: altrimenti i test vengono saltati.
+"""
+import os
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+duckdb = pytest.importorskip("duckdb")
+
+from src.bybit_client import BybitClient
+from src.db_manager import DBManager
+from src.duckdb_backend import DuckDBManager
+
+
+def sqlite_extension_available():
+    try:
+        duckdb.connect().execute("LOAD sqlite")
+        return True
+    except Exception:
+        return False
+
+
+pytestmark = pytest.mark.skipif(not sqlite_extension_available(), reason="DuckDB sqlite extension not installed")
+
+
+def make_trades(count, seed=0):
+    rng = np.random.default_rng(seed)
+    updated = pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 90 * 24 * 60, count), unit='m')
+    category = rng.choice(['linear', 'inverse'], count)
+    df = pd.DataFrame({
+        'symbol': np.where(category == 'inverse', 'BTCUSD', 'BTCUSDT'),
+        'category': category,
+        'orderId': [f'order-{seed}-{i}' for i in range(count)],
+        'side': rng.choice(['Buy', 'Sell'], count),
+        'closedSize': rng.uniform(0.1, 2, count),
+        'avgEntryPrice': rng.uniform(100, 200, count),
+        'avgExitPrice': rng.uniform(100, 200, count),
+        'closedPnl': rng.normal(0, 5, count),
+        'fillCount': rng.integers(1, 4, count),
+        'createdTime': updated - pd.to_timedelta(rng.integers(1, 600, count), unit='m'),
+        'updatedTime': updated,
+    })
+    df['invested_capital'] = df['closedSize'] * df['avgEntryPrice']
+    df['pct'] = (df['closedPnl'] / df['invested_capital'] * 100).round(2)
+    return df
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """Database SQLite di un account in una directory temporanea"""
+    monkeypatch.chdir(tmp_path)
+    db = DBManager('acc')
+    db.save_trades(make_trades(500))
+    return db
+
+
+@pytest.mark.parametrize('timeframe', ['1d', '1w', '1M'])
+def test_aggregates_from_sqlite_match_pandas(store, timeframe):
+    trades = store.get_trades()
+    backend = DuckDBManager('acc')
+    try:
+        for filters in ({'category': 'linear'}, {'category': 'inverse', 'side': 'Buy'}):
+            expected = trades
+            for column, value in filters.items():
+                expected = expected[expected[column] == value]
+            expected = BybitClient.aggregate_pnl(expected, timeframe)
+            result = backend.aggregate_pnl(timeframe, **filters)
+            pd.testing.assert_frame_equal(result[expected.columns], expected, check_dtype=False, check_freq=False)
+
+        assert backend.get_metrics(category='inverse')['total_trades'] == (trades['category'] == 'inverse').sum()
+    finally:
+        backend.close()
+
+
+def test_pnl_is_not_aggregated_across_categories(store):
+    trades = store.get_trades()
+    backend = DuckDBManager('acc')
+    try:
+        with pytest.raises(ValueError, match="across categories"):
+            BybitClient.aggregate_pnl(trades, '1d')
+        with pytest.raises(ValueError, match="across categories"):
+            backend.aggregate_pnl('1d')
+        with pytest.raises(ValueError, match="across categories"):
+            backend.get_metrics(side='Buy')
+    finally:
+        backend.close()
+
+
+def test_fees_and_funding_are_attached_to_duckdb_trades(store):
+    # DuckDB restituisce i tempi in datetime64[us], le tabelle lette da SQLite in datetime64[ns]
+    trades = store.get_trades(category='linear').sort_values('updatedTime')
+    first, second = trades.iloc[0], trades.iloc[1]
+    store.save_executions(pd.DataFrame({
+        'execId': ['e1', 'e2'],
+        'symbol': [first['symbol'], second['symbol']],
+        'category': 'linear',
+        'execFee': [0.5, 0.25],
+        'execTime': [first['updatedTime'], second['updatedTime']],
+    }))
+    store.save_funding(pd.DataFrame({
+        'id': ['f1'], 'symbol': [second['symbol']], 'category': 'linear',
+        'funding': [-0.1], 'transactionTime': [second['updatedTime'] - pd.Timedelta(seconds=1)],
+    }))
+
+    backend = DuckDBManager('acc')
+    try:
+        df = backend.add_fees_and_funding(backend.get_trades(category='linear')).set_index('orderId')
+    finally:
+        backend.close()
+
+    assert df.loc[first['orderId'], 'fees'] == pytest.approx(0.5)
+    assert df.loc[second['orderId'], 'fees'] == pytest.approx(0.25)
+    assert df.loc[second['orderId'], 'funding'] == pytest.approx(-0.1)
+    assert df['fees'].sum() == pytest.approx(0.75)
+
+
+def test_stale_parquet_is_ignored(store):
+    store.get_trades().head(10).to_parquet('data/acc_trades.parquet')
+    # Il Parquet risulta più vecchio del database, che poi riceve nuove scritture
+    old = time.time() - 3600
+    os.utime('data/acc_trades.parquet', (old, old))
+    store.upsert_trades(make_trades(5, seed=1))
+
+    backend = DuckDBManager('acc')
+    try:
+        assert len(backend.get_trades()) == 505
+    finally:
+        backend.close()
+
+
+def test_trades_without_category_count_as_default_category(store):
+    expected = len(store.get_trades(category='linear'))
+    # Righe senza categoria scritte direttamente, come in un database aggiornato prima della correzione
+    conn = sqlite3.connect('data/acc_trades.sqlite')
+    conn.execute("UPDATE trades SET category = NULL WHERE category = 'linear'")
+    conn.commit()
+    conn.close()
+
+    backend = DuckDBManager('acc')
+    try:
+        assert expected > 0
+        assert len(backend.get_trades(category='linear')) == expected
+        assert backend.get_trades()['category'].notna().all()
+    finally:
+        backend.close()
+
+
+class OfflineConnection:
+    """Connessione DuckDB senza estensione sqlite installata né accesso alla rete"""
+
+    def execute(self, sql):
+        raise duckdb.IOException('Failed to download extension "sqlite_scanner"')
+
+    def close(self):
+        pass
+
+
+def test_missing_extension_raises_a_clear_error():
+    backend = DuckDBManager.__new__(DuckDBManager)
+    backend.accounts, backend.writer, backend.conn = ['acc'], None, OfflineConnection()
+    with pytest.raises(RuntimeError, match="install_extension"):
+        backend._load_sqlite_extension()
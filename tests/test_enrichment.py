@@ -0,0 +1,79 @@
+import pandas as pd
+import pytest
+
+from src.enrichment import attach_fees_and_funding
+
+
+def trades():
+    """Due chiusure BTCUSDT linear, una ETHUSDT linear e una BTCUSD inverse"""
+    return pd.DataFrame({
+        'orderId': ['btc-1', 'btc-2', 'eth-1', 'inv-1'],
+        'symbol': ['BTCUSDT', 'BTCUSDT', 'ETHUSDT', 'BTCUSD'],
+        'category': ['linear', 'linear', 'linear', 'inverse'],
+        'closedPnl': [10.0, -5.0, 3.0, 0.001],
+        'updatedTime': pd.to_datetime(['2024-01-01 10:00', '2024-01-02 10:00', '2024-01-01 12:00', '2024-01-01 10:00']),
+    }).set_index('orderId')
+
+
+def executions(rows):
+    return pd.DataFrame(rows, columns=['execTime', 'symbol', 'category', 'execFee']).astype({'execTime': 'datetime64[ns]'})
+
+
+def funding(rows):
+    return pd.DataFrame(rows, columns=['transactionTime', 'symbol', 'category', 'funding']).astype(
+        {'transactionTime': 'datetime64[ns]'})
+
+
+def test_events_are_attributed_to_the_next_close_of_the_same_symbol_and_category():
+    result = attach_fees_and_funding(
+        trades(),
+        executions([
+            ('2024-01-01 08:00', 'BTCUSDT', 'linear', 0.4),   # apertura della prima posizione
+            ('2024-01-01 10:00', 'BTCUSDT', 'linear', 0.6),   # chiusura, stesso istante del trade
+            ('2024-01-01 11:00', 'BTCUSDT', 'linear', 0.2),   # apertura della seconda posizione
+            ('2024-01-01 09:00', 'BTCUSD', 'inverse', 0.00001),
+            ('2024-01-01 09:00', 'BTCUSD', 'linear', 9.0),    # nessun trade BTCUSD linear
+        ]),
+        funding([
+            ('2024-01-01 08:00', 'BTCUSDT', 'linear', -0.3),
+            ('2024-01-01 16:00', 'BTCUSDT', 'linear', 0.1),
+            ('2024-01-01 08:00', 'ETHUSDT', 'linear', 0.05),
+        ]),
+    )
+
+    assert result['fees'].to_dict() == pytest.approx({'btc-1': 1.0, 'btc-2': 0.2, 'eth-1': 0.0, 'inv-1': 0.00001})
+    assert result['funding'].to_dict() == pytest.approx({'btc-1': -0.3, 'btc-2': 0.1, 'eth-1': 0.05, 'inv-1': 0.0})
+
+
+def test_events_after_the_last_close_are_not_attributed():
+    result = attach_fees_and_funding(
+        trades(),
+        executions([('2024-01-03 00:00', 'BTCUSDT', 'linear', 0.5)]),
+        funding([('2024-01-02 10:00:01', 'BTCUSDT', 'linear', -0.2)]),
+    )
+
+    assert (result['fees'] == 0).all()
+    assert (result['funding'] == 0).all()
+
+
+def test_closed_pnl_is_net_of_fees_and_funding():
+    result = attach_fees_and_funding(
+        trades(),
+        executions([('2024-01-01 08:00', 'BTCUSDT', 'linear', 1.5)]),
+        funding([('2024-01-01 08:00', 'BTCUSDT', 'linear', -0.5), ('2024-01-02 08:00', 'BTCUSDT', 'linear', 0.25)]),
+    )
+
+    # btc-1: posizione +12 - fee 1.5 - funding pagato 0.5 = closedPnl 10
+    assert result.loc['btc-1', 'gross_pnl'] == pytest.approx(12.0)
+    assert result.loc['btc-1', 'net_pnl'] == pytest.approx(10.0)
+    # btc-2: funding incassato 0.25 già compreso nel closedPnl
+    assert result.loc['btc-2', 'gross_pnl'] == pytest.approx(-5.25)
+    assert (result['net_pnl'] == result['closedPnl']).all()
+
+
+def test_time_keys_with_different_resolutions_are_merged():
+    # Trades da DuckDB (datetime64[us]) con eventi letti da SQLite (datetime64[ns])
+    df = trades().astype({'updatedTime': 'datetime64[us]'})
+    result = attach_fees_and_funding(df, executions([('2024-01-01 08:00', 'ETHUSDT', 'linear', 0.7)]), funding([]))
+
+    assert result.loc['eth-1', 'fees'] == pytest.approx(0.7)
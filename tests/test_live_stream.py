@@ -0,0 +1,226 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import threading
+import time
+
+import pytest
+import websockets
+
+from src import config
+from src.db_manager import DBManager
+from src.live_stream import LivePnlStream
+
+
+@pytest.fixture
+def account(monkeypatch):
+    monkeypatch.setenv('BYBIT_API_KEY_LIVE', 'key')
+    monkeypatch.setenv('BYBIT_API_SECRET_LIVE', 'secret')
+    config.load_settings.cache_clear()
+    yield 'LIVE'
+    config.load_settings.cache_clear()
+
+
+class FakeClient:
+    """Client REST che restituisce le posizioni aperte prima dell'avvio dello stream"""
+
+    def __init__(self, positions):
+        self.positions = positions
+
+    def get_open_positions(self, categories=None):
+        return [dict(position, category='linear') for position in self.positions]
+
+
+def execution(order_id, qty, price, leaves='0'):
+    return {
+        'category': 'linear', 'symbol': 'BTCUSDT', 'orderId': order_id, 'side': 'Sell',
+        'orderType': 'Market', 'execType': 'Trade', 'execPrice': price, 'execQty': qty,
+        'closedSize': qty, 'execFee': '0.1', 'leavesQty': leaves, 'execTime': '1700000060000',
+    }
+
+
+def test_closing_a_position_opened_before_the_stream_produces_a_record(account):
+    stream = LivePnlStream(account, on_trades=lambda records: None)
+    stream._client = FakeClient([{'symbol': 'BTCUSDT', 'size': '0.5', 'avgPrice': '30000',
+                                  'createdTime': '1700000000000'}])
+    stream.load_open_positions()
+
+    # Chiusura in un solo ordine: Bybit invia la posizione con size 0, poi l'esecuzione
+    stream.handle_message({'topic': 'position', 'data': [
+        {'category': 'linear', 'symbol': 'BTCUSDT', 'size': '0', 'avgPrice': '0'}]})
+    records = stream.handle_message({'topic': 'execution', 'data': [execution('o1', '0.5', '31000')]})
+
+    assert len(records) == 1
+    assert records[0]['avgEntryPrice'] == '30000.0'
+    assert float(records[0]['closedPnl']) == pytest.approx(0.5 * 1000 - 0.1)
+    assert records[0]['createdTime'] == '1700000000000'
+
+
+class CountingStream(LivePnlStream):
+    """Stream che registra gli avvii senza aprire connessioni"""
+
+    def _start_thread(self):
+        self._stop.clear()
+
+    @property
+    def running(self):
+        return not self._stop.is_set()
+
+
+def test_stream_runs_while_any_subscriber_uses_it(account):
+    stream = CountingStream(account)
+    stream.subscribe('session-a')
+    stream.subscribe('session-b')
+    stream.unsubscribe('session-a')
+    assert stream.running
+
+    stream.unsubscribe('session-b')
+    assert not stream.running
+
+
+def test_inactive_subscribers_are_released(account):
+    active = {'session-a', 'session-b'}
+    stream = CountingStream(account, is_subscriber_active=lambda s: s in active)
+    stream.subscribe('session-a')
+    stream.subscribe('session-b')
+
+    active.discard('session-a')
+    stream.release_inactive()
+    assert stream._subscribers == {'session-b'}
+    assert not stream._stop.is_set()
+
+    active.clear()
+    stream.release_inactive()
+    assert stream._stop.is_set()
+
+
+def test_unsubscribe_waits_for_the_thread_outside_the_lock(account):
+    # Nessun server in ascolto: lo stream resta in attesa di riconnettersi
+    stream = LivePnlStream(account, url='ws://127.0.0.1:1')
+    stream.subscribe('session-a')
+
+    # Durante l'attesa il thread dello stream deve poter rilasciare gli utilizzatori
+    blocked = []
+    original_join = stream._join
+
+    def join():
+        acquired = stream._subscribers_lock.acquire(timeout=1)
+        blocked.append(not acquired)
+        if acquired:
+            stream._subscribers_lock.release()
+        original_join()
+
+    stream._join = join
+    stream.unsubscribe('session-a')
+    assert blocked == [False]
+    assert not stream.is_running()
+
+
+class FakePrivateStream:
+    """
+    Server WebSocket locale che imita il flusso privato di Bybit, in un thread dedicato:
+    verifica l'autenticazione, risponde ai ping e alla prima connessione invia la chiusura
+    di una posizione aperta prima dello stream, poi si disconnette; alla seconda invia
+    l'apertura e la chiusura di una nuova posizione
+    """
+
+    def __init__(self, api_key, api_secret):
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.connections = 0
+        self.pings = 0
+        self.subscriptions = []
+        self.loop = asyncio.new_event_loop()
+        self.server = None
+        self.url = None
+
+    def _check_auth(self, message):
+        api_key, expires, signature = message['args']
+        expected = hmac.new(self.api_secret.encode(), f"GET/realtime{expires}".encode(), hashlib.sha256).hexdigest()
+        return message['op'] == 'auth' and api_key == self.api_key and signature == expected
+
+    async def handler(self, ws):
+        self.connections += 1
+        connection = self.connections
+        if not self._check_auth(json.loads(await ws.recv())):
+            await ws.send(json.dumps({'op': 'auth', 'success': False, 'ret_msg': 'invalid signature'}))
+            return
+        await ws.send(json.dumps({'op': 'auth', 'success': True}))
+        self.subscriptions.append(json.loads(await ws.recv())['args'])
+
+        if connection == 1:
+            # Posizione BTCUSDT aperta prima dello stream (nota solo da REST) chiusa in un solo ordine
+            await ws.send(json.dumps({'topic': 'position', 'data': [
+                {'category': 'linear', 'symbol': 'BTCUSDT', 'size': '0', 'avgPrice': '0'}]}))
+            await ws.send(json.dumps({'topic': 'execution', 'data': [execution('o1', '0.5', '31000')]}))
+        else:
+            await ws.send(json.dumps({'topic': 'position', 'data': [
+                {'category': 'linear', 'symbol': 'ETHUSDT', 'size': '2', 'avgPrice': '2000',
+                 'createdTime': '1700000100000'}]}))
+            await ws.send(json.dumps({'topic': 'execution', 'data': [
+                dict(execution('o2', '2', '1900'), symbol='ETHUSDT', execTime='1700000200000')]}))
+
+        async for raw in ws:
+            if json.loads(raw).get('op') == 'ping':
+                self.pings += 1
+                await ws.send(json.dumps({'op': 'pong', 'success': True}))
+                if connection == 1:
+                    # Disconnessione dopo il primo ping: lo stream deve riconnettersi
+                    return
+
+    async def _start(self):
+        self.server = await websockets.serve(self.handler, '127.0.0.1', 0)
+        host, port = self.server.sockets[0].getsockname()[:2]
+        self.url = f'ws://{host}:{port}'
+
+    def start(self):
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+        asyncio.run_coroutine_threadsafe(self._start(), self.loop).result(timeout=10)
+
+    def stop(self):
+        async def close():
+            self.server.close()
+            await self.server.wait_closed()
+        asyncio.run_coroutine_threadsafe(close(), self.loop).result(timeout=10)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+@pytest.fixture
+def private_stream():
+    server = FakePrivateStream('key', 'secret')
+    server.start()
+    yield server
+    server.stop()
+
+
+def test_live_stream_stores_closed_trades_from_the_websocket(account, private_stream, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(LivePnlStream, 'PING_INTERVAL', 0.5)
+    monkeypatch.setattr(LivePnlStream, 'RECONNECT_DELAY', 0.1)
+
+    stream = LivePnlStream(account, url=private_stream.url)
+    # Seed REST delle posizioni aperte; il resto del client (normalizzazione dei record) è quello reale
+    monkeypatch.setattr(stream._client, 'get_open_positions', FakeClient([
+        {'symbol': 'BTCUSDT', 'size': '0.5', 'avgPrice': '30000', 'createdTime': '1700000000000'}
+    ]).get_open_positions)
+    stream.subscribe('session-a')
+    try:
+        deadline = time.monotonic() + 15
+        while stream.trades_received < 2 and time.monotonic() < deadline:
+            time.sleep(0.1)
+    finally:
+        stream.unsubscribe('session-a')
+
+    assert not stream.is_running()
+    assert private_stream.connections == 2
+    assert private_stream.pings >= 1
+    assert private_stream.subscriptions == [['position', 'execution']] * 2
+
+    # Record salvati dalla callback di default (DBManager.upsert_trades)
+    trades = DBManager(account).get_trades().set_index('orderId')
+    assert sorted(trades.index) == ['o1', 'o2']
+    assert trades.loc['o1', 'avgEntryPrice'] == 30000
+    assert trades.loc['o1', 'closedPnl'] == pytest.approx(0.5 * 1000 - 0.1)
+    assert trades.loc['o2', 'closedPnl'] == pytest.approx(2 * (1900 - 2000) - 0.1)
+    assert trades.loc['o2', 'side'] == 'Buy'  # Side corretto come per i record closed-pnl
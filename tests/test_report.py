@@ -0,0 +1,60 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import report
+from src.db_manager import DBManager
+
+
+def save_trades(account, days):
+    updated = pd.Timestamp('2024-01-01') + pd.to_timedelta(np.arange(days), unit='D') + pd.Timedelta(hours=12)
+    DBManager(account).save_trades(pd.DataFrame({
+        'symbol': 'BTCUSDT',
+        'category': 'linear',
+        'orderId': [f'{account}-{i}' for i in range(days)],
+        'side': 'Buy',
+        'closedSize': 1.0,
+        'avgEntryPrice': 100.0,
+        'closedPnl': 1.0,
+        'fillCount': 1,
+        'invested_capital': 100.0,
+        'createdTime': updated - pd.Timedelta(hours=1),
+        'updatedTime': updated,
+    }))
+
+
+def test_accounts_without_local_data_are_skipped(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    summaries = report.build_account_report('Other', None, datetime(2024, 2, 1), 'All', '1d', tmp_path / 'reports')
+
+    assert summaries[0]['total_trades'] == 0
+    assert not DBManager.database_path('Other').exists()
+
+
+def test_custom_period_includes_the_whole_end_day(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    save_trades('acc', 31)
+
+    start_time, end_time = datetime.fromisoformat('2024-01-10'), report.parse_end('2024-01-19')
+    summaries = report.build_account_report('acc', start_time, end_time, 'custom', '1d', tmp_path / 'reports')
+
+    assert [(s['category'], s['total_trades']) for s in summaries] == [('linear', 10)]
+    assert (tmp_path / 'reports' / 'acc' / 'linear' / 'summary.json').exists()
+
+
+def test_export_writes_all_accounts_to_one_file(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    save_trades('acc', 31)
+    save_trades('second', 5)
+    monkeypatch.setattr('sys.argv', [
+        'report.py', '--accounts', 'acc', 'second', 'other', '--start', '2024-01-01', '--end', '2024-01-10',
+        '--workers', '1', '--export', 'exports/trades.csv',
+    ])
+
+    assert report.main() == 0
+
+    exported = pd.read_csv('exports/trades.csv')
+    assert exported['account'].value_counts().to_dict() == {'acc': 10, 'second': 5}
+    assert not DBManager.database_path('other').exists()